@@ -1,17 +1,22 @@
 import os
+import hashlib
+import itertools
 from datetime import datetime, timezone, timedelta
 
-import numpy as np
-import pandas as pd
-
+import psycopg
 from dotenv import load_dotenv
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
-from sqlalchemy import create_engine, text
 import json
 
+from db import DATABASE_URL, read_engine, sqlalchemy_url
+from lag_sketch import merge as merge_sketches, quantile
+from startup import exit_if_check
+
+# numpy, pandas, scipy, sklearn and SQLAlchemy are imported where they are used, once there is data to cluster
+LAZY_DEPS = ("numpy", "pandas", "sklearn", "sqlalchemy", "scipy")
+
 load_dotenv()
-SQLALCHEMY_DATABASE_URL = os.environ.get("SQLALCHEMY_DATABASE_URL", os.environ["DATABASE_URL"])
+# same driver (psycopg v3) as pipeline.py; psycopg2 is not a dependency
+SQLALCHEMY_DATABASE_URL = sqlalchemy_url(os.environ.get("SQLALCHEMY_DATABASE_URL", os.environ["DATABASE_URL"]))
 
 def utc_now():
     return datetime.now(timezone.utc)
@@ -20,25 +25,159 @@ def label_for_centroid(c):
     # c is in standardized space, we will label using heuristics on raw later
     return "General"
 
-def main(k=3, days=30):
+def load_previous_model(connection):
+    from sqlalchemy import text
+
+    row = connection.execute(text(
+        'SELECT centroids FROM "SegmentModel" ORDER BY "lastUsedAt" DESC LIMIT 1'
+    )).fetchone()
+    return row[0] if row else []
+
+def align_segments(centers_std, prev: list, scaler, feature_cols) -> list:
+    """Maps each new cluster index to a segment id, reusing the id of the matching previous centroid."""
+    k = len(centers_std)
+    if not prev:
+        return list(range(k))
+
+    import numpy as np
+    from scipy.optimize import linear_sum_assignment
+
+    prev_std = scaler.transform(np.array([[p["centroid"].get(c, 0.0) for c in feature_cols] for p in prev], dtype=float))
+    cost = ((centers_std[:, None, :] - prev_std[None, :, :]) ** 2).sum(axis=2)
+    rows, cols = linear_sum_assignment(cost)
+    mapping = {int(r): int(prev[c]["segment"]) for r, c in zip(rows, cols)}
+
+    used = set(mapping.values())
+    free = (i for i in itertools.count() if i not in used)
+    return [mapping[i] if i in mapping else next(free) for i in range(k)]
+
+def save_model(connection, centroids: list, k: int, featuresRef: dict) -> str:
+    """
+    Stores centroids once per model version (content hash); returns the version.
+    featuresRef carries the scaler (features, mean, scale) the realtime worker assigns users with.
+    """
+    from sqlalchemy import text
+
+    body = json.dumps(
+        [{**c, "centroid": {f: round(v, 6) for f, v in c["centroid"].items()}} for c in centroids],
+        sort_keys=True,
+    )
+    version = hashlib.sha1(body.encode()).hexdigest()[:16]
+    connection.execute(
+        text("""
+            INSERT INTO "SegmentModel" (id, k, centroids, "featuresRef", "createdAt", "lastUsedAt")
+            VALUES (:id, :k, CAST(:centroids AS jsonb), CAST(:featuresRef AS jsonb), now(), now())
+            ON CONFLICT (id) DO UPDATE SET "lastUsedAt" = now(), "featuresRef" = EXCLUDED."featuresRef"
+        """),
+        {"id": version, "k": k, "centroids": body, "featuresRef": json.dumps(featuresRef)},
+    )
+    return version
+
+def write_changed_segments(connection, assignments: dict, featuresRef: dict) -> list:
+    """
+    assignments: userId -> (segment, label). Writes only users whose segment or label changed,
+    as one bulk upsert; centroid is left NULL (it lives on SegmentModel).
+    """
+    from sqlalchemy import text
+
+    existing = connection.execute(
+        text('SELECT "userId", segment, label FROM "UserSegment" WHERE "userId" = ANY(:ids)'),
+        {"ids": list(assignments)},
+    ).fetchall()
+    current = {user_id: (seg, label) for user_id, seg, label in existing}
+
+    changed = [
+        {"userId": user_id, "segment": seg, "label": label}
+        for user_id, (seg, label) in assignments.items()
+        if current.get(user_id) != (seg, label)
+    ]
+    if not changed:
+        return []
+
+    connection.execute(
+        text("""
+            INSERT INTO "UserSegment" (id, "userId", segment, label, centroid, "featuresRef", "updatedAt")
+            SELECT gen_random_uuid()::text, x."userId", x.segment, x.label, NULL, CAST(:featuresRef AS jsonb), now()
+            FROM jsonb_to_recordset(CAST(:rows AS jsonb)) AS x("userId" text, segment int, label text)
+            ON CONFLICT ("userId")
+            DO UPDATE SET
+            segment = EXCLUDED.segment,
+            label = EXCLUDED.label,
+            centroid = NULL,
+            "featuresRef" = EXCLUDED."featuresRef",
+            "updatedAt" = now()
+        """),
+        {"rows": json.dumps(changed), "featuresRef": json.dumps(featuresRef)},
+    )
+    return [c["userId"] for c in changed]
+
+def has_window_data(start_day: datetime) -> bool:
+    """Cheap EXISTS on the primary, so a no-data cron run never imports the heavy libraries."""
+    with psycopg.connect(DATABASE_URL) as conn, conn.cursor() as cur:
+        cur.execute('SELECT EXISTS (SELECT 1 FROM "DailyUserFeatures" WHERE day >= %s)', (start_day,))
+        return bool(cur.fetchone()[0])
+
+def load_window(engine, start_day: datetime, features_today: dict = None, primary=None):
+    """
+    DailyUserFeatures rows for the window, read on engine.
+    features_today (userId -> feature dict) from daily_features replaces today's rows. Without it,
+    today's rows are read on primary when engine is a replica: the cron step has just written them.
+    """
+    import pandas as pd
+
+    sql = """
+        SELECT "userId", day,
+            "createdCount", "completedCount", "completionRate",
+            "overdueCount", "avgCompletionLagH",
+            "createdMorning", "createdAfternoon", "createdEvening", "createdNight",
+            "completionLagSumH", "completionLagCount", "completionLagSketch"
+        FROM "DailyUserFeatures"
+        WHERE day >= %(start)s
+    """
+    params = {"start": start_day}
+    if features_today is None and (primary is None or primary is engine):
+        return pd.read_sql(sql, con=engine, params=params)
+
+    now = utc_now()
+    today_start = datetime(now.year, now.month, now.day, tzinfo=timezone.utc)
+    df = pd.read_sql(sql + ' AND day < %(today)s', con=engine, params={**params, "today": today_start})
+    if features_today is None:
+        today_df = pd.read_sql(sql + ' AND day >= %(today)s', con=primary, params={**params, "today": today_start})
+    elif features_today:
+        today_df = pd.DataFrame(
+            [{"userId": user_id, "day": today_start, **f} for user_id, f in features_today.items()]
+        )
+    else:
+        return df
+    if today_df.empty:
+        return df
+    return pd.concat([df, today_df], ignore_index=True) if not df.empty else today_df
+
+def main(k=3, days=30, engine=None, features_today: dict = None, reader=None):
+    """reader: engine for the window read (e.g. the pipeline's replica pool); by default read_engine(engine)."""
     end = utc_now()
     start = end - timedelta(days=days)
     start_day = datetime(start.year, start.month, start.day, tzinfo=timezone.utc)
-   
-    engine = create_engine(SQLALCHEMY_DATABASE_URL)
-
-    df = pd.read_sql(
-        """
-            SELECT "userId", day,
-                "createdCount", "completedCount", "completionRate",
-                "overdueCount", "avgCompletionLagH",
-                "createdMorning", "createdAfternoon", "createdEvening", "createdNight"
-            FROM "DailyUserFeatures"
-            WHERE day >= %(start)s
-        """,
-        con=engine,
-        params={"start": start_day},
-    )
+
+    if engine is None:
+        if not features_today and not has_window_data(start_day):
+            print("[cluster] no data")
+            return
+
+        from sqlalchemy import create_engine
+
+        engine = create_engine(SQLALCHEMY_DATABASE_URL)
+
+    # the window read can go to a replica; segment writes stay on engine
+    if reader is not None:
+        df = load_window(reader, start_day, features_today, primary=engine)
+    else:
+        reader = read_engine(engine)
+        try:
+            df = load_window(reader, start_day, features_today, primary=engine)
+        finally:
+            if reader is not engine:
+                reader.dispose()
 
     if df.empty:
         print("[cluster] no data")
@@ -50,18 +189,26 @@ def main(k=3, days=30):
         "completedCount": "sum",
         "completionRate": "mean",
         "overdueCount": "mean",
-        "avgCompletionLagH": "mean",
+        "completionLagSumH": "sum",
+        "completionLagCount": "sum",
         "createdMorning": "sum",
         "createdAfternoon": "sum",
         "createdEvening": "sum",
         "createdNight": "sum",
     }).reset_index()
 
+    # Completion lag over the window: exact mean per task, quantiles from the merged daily sketches
+    agg["avgCompletionLagH"] = (agg["completionLagSumH"] / agg["completionLagCount"].where(agg["completionLagCount"] > 0)).fillna(0.0)
+    sketches = {user_id: merge_sketches(s) for user_id, s in df.groupby("userId")["completionLagSketch"]}
+    agg["completionLagP50H"] = [quantile(sketches[u], 0.5) for u in agg["userId"]]
+    agg["completionLagP90H"] = [quantile(sketches[u], 0.9) for u in agg["userId"]]
+
     # Build feature matrix
     feature_cols = [
         "createdCount","completedCount","completionRate",
         "overdueCount","avgCompletionLagH",
-        "createdMorning","createdAfternoon","createdEvening","createdNight"
+        "createdMorning","createdAfternoon","createdEvening","createdNight",
+        "completionLagP50H","completionLagP90H",
     ]
     X = agg[feature_cols].to_numpy(dtype=float)
 
@@ -71,6 +218,9 @@ def main(k=3, days=30):
         print("[cluster] not enough users")
         return
 
+    from sklearn.cluster import KMeans
+    from sklearn.preprocessing import StandardScaler
+
     scaler = StandardScaler()
     Xs = scaler.fit_transform(X)
 
@@ -80,50 +230,49 @@ def main(k=3, days=30):
     # Inverse transform centroids for interpretability
     centroids_raw = scaler.inverse_transform(km.cluster_centers_)
 
-    # Simple persona labels based on raw centroid stats
-    persona_labels = {}
-    for i, c in enumerate(centroids_raw):
-        created, completed, rate, overdue, lag, m, a, e, n = c
-        if rate >= 0.7 and overdue < 1:
-            persona = "Finisher"
-        elif created > 20 and rate < 0.5:
-            persona = "Overplanner"
-        elif n > max(m,a,e):
-            persona = "Night Owl"
-        elif overdue >= 2:
-            persona = "Deadline Struggler"
-        else:
-            persona = "Balanced"
-        persona_labels[i] = persona
+    featuresRef = {"windowDays": days, "from": start_day.isoformat()}
 
     with engine.begin() as connection:
-        for idx, row in agg.iterrows():
-            user_id = row["userId"]
-            seg = int(labels[idx])
-            centroid = {col: float(v) for col, v in zip(feature_cols, centroids_raw[seg])}
-
-            connection.execute(
-                text("""
-                    INSERT INTO "UserSegment" ("userId", segment, label, centroid, "featuresRef")
-                    VALUES (:userId, :segment, :label, CAST(:centroid AS jsonb), CAST(:featuresRef AS jsonb))
-                    ON CONFLICT ("userId")
-                    DO UPDATE SET
-                    segment = EXCLUDED.segment,
-                    label = EXCLUDED.label,
-                    centroid = EXCLUDED.centroid,
-                    "featuresRef" = EXCLUDED."featuresRef",
-                    "updatedAt" = now()
-                """),
-                {
-                    "userId": user_id,
-                    "segment": seg,
-                    "label": persona_labels[seg],
-                    "centroid": json.dumps(centroid),
-                    "featuresRef": json.dumps({"windowDays": days, "from": start_day.isoformat()}),
-                }
-            )
-
-    print(f"[cluster] clustered users={len(agg)} k={k_eff}")
+        # Keep segment ids stable across runs so unchanged users are not rewritten
+        prev = load_previous_model(connection)
+        segment_ids = align_segments(km.cluster_centers_, prev, scaler, feature_cols)
+
+        # Simple persona labels based on raw centroid stats
+        persona_labels = {}
+        for i, c in enumerate(centroids_raw):
+            created, completed, rate, overdue, lag, m, a, e, n = c[:9]
+            if rate >= 0.7 and overdue < 1:
+                persona = "Finisher"
+            elif created > 20 and rate < 0.5:
+                persona = "Overplanner"
+            elif n > max(m,a,e):
+                persona = "Night Owl"
+            elif overdue >= 2:
+                persona = "Deadline Struggler"
+            else:
+                persona = "Balanced"
+            persona_labels[segment_ids[i]] = persona
+
+        centroids = [
+            {
+                "segment": segment_ids[i],
+                "label": persona_labels[segment_ids[i]],
+                "centroid": {col: float(v) for col, v in zip(feature_cols, c)},
+            }
+            for i, c in enumerate(centroids_raw)
+        ]
+        scaler_ref = {"features": feature_cols, "mean": scaler.mean_.tolist(), "scale": scaler.scale_.tolist()}
+        version = save_model(connection, centroids, k_eff, {**featuresRef, **scaler_ref})
+
+        assignments = {
+            user_id: (segment_ids[int(lbl)], persona_labels[segment_ids[int(lbl)]])
+            for user_id, lbl in zip(agg["userId"], labels)
+        }
+        changed = write_changed_segments(connection, assignments, {**featuresRef, "model": version})
+
+    print(f"[cluster] clustered users={len(agg)} k={k_eff} changed={len(changed)} model={version}")
+    return changed
 
 if __name__ == "__main__":
+    exit_if_check("cluster", LAZY_DEPS)
     main()
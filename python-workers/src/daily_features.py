@@ -5,6 +5,12 @@ import uuid
 import psycopg
 from dotenv import load_dotenv
 
+from db import open_read_router
+from event_rollup import compact, day_counts, created_by_hour
+from lag_sketch import empty
+from startup import exit_if_check
+from task_timing import backfill_for_window
+
 load_dotenv()
 DATABASE_URL = os.environ["DATABASE_URL"]
 
@@ -20,83 +26,80 @@ def bucket_hour(h: int):
         return "evening"
     return "night"
 
-def compute_for_day(conn, day: date):
+def compute_for_day(conn, day: date, counts: dict = None, read_conn=None) -> dict:
+    """
+    Returns userId -> feature dict for the day.
+    counts (userId -> (created, completed)) can be passed in from daily_stats to skip re-reading the rollup.
+    read_conn (e.g. a replica) serves the Task due/overdue read; everything else uses conn.
+    """
     start = utc_day_start(day)
     end = start + timedelta(days=1)
     now = datetime.now(timezone.utc)
 
     with conn.cursor() as cur:
-        # Created/Completed counts via TaskEvent
-        cur.execute(
-            """
-            SELECT "userId",
-                   COUNT(*) FILTER (WHERE type='TASK_CREATED')::int AS created_count,
-                   COUNT(*) FILTER (WHERE type='TASK_COMPLETED')::int AS completed_count
-            FROM "TaskEvent"
-            WHERE "createdAt" >= %s AND "createdAt" < %s
-            GROUP BY "userId"
-            """,
-            (start, end),
-        )
-        rows = cur.fetchall()
+        # completions the realtime worker has not folded yet; added to its totals, never overwriting them
+        claimed = backfill_for_window(cur, start, end)
 
-        for user_id, created_count, completed_count in rows:
-            created_count = int(created_count or 0)
-            completed_count = int(completed_count or 0)
-            completion_rate = (completed_count / created_count) if created_count > 0 else 0.0
+        # Created/Completed counts and created-hour buckets via the hourly rollup
+        # (counts from daily_stats means it has just compacted)
+        if counts is None:
+            compact(cur)
+            rows = day_counts(cur, start, end)
+        else:
+            rows = [(user_id, c, d) for user_id, (c, d) in counts.items()]
 
-            # Tasks with dueAt & overdue (as of now) for that user
-            cur.execute(
+        buckets_by_user = {}
+        for user_id, hour, cnt in created_by_hour(cur, start, end):
+            b = buckets_by_user.setdefault(user_id, {"morning": 0, "afternoon": 0, "evening": 0, "night": 0})
+            b[bucket_hour(int(hour))] += int(cnt)
+
+        # Tasks with dueAt & overdue (as of now), one read for all users of the day
+        with (read_conn or conn).cursor() as rcur:
+            rcur.execute(
                 """
-                SELECT
+                SELECT "userId",
                   COUNT(*) FILTER (WHERE "dueAt" IS NOT NULL)::int AS tasks_with_due,
                   COUNT(*) FILTER (WHERE "dueAt" IS NOT NULL AND status != 'DONE' AND "dueAt" < %s)::int AS overdue_count
                 FROM "Task"
-                WHERE "userId" = %s
+                WHERE "userId" = ANY(%s)
+                GROUP BY "userId"
                 """,
-                (now, user_id),
+                (now, [r[0] for r in rows]),
             )
-            tasks_with_due, overdue_count = cur.fetchone()
+            due_by_user = {user_id: (d, o) for user_id, d, o in rcur.fetchall()}
+
+        features = {}
+
+        for user_id, created_count, completed_count in rows:
+            created_count = int(created_count or 0)
+            completed_count = int(completed_count or 0)
+            completion_rate = (completed_count / created_count) if created_count > 0 else 0.0
+
+            tasks_with_due, overdue_count = due_by_user.get(user_id, (0, 0))
             tasks_with_due = int(tasks_with_due or 0)
             overdue_count = int(overdue_count or 0)
 
-            # Completion lag average (hours): join TASK_CREATED and TASK_COMPLETED by taskId within window
-            cur.execute(
-                """
-                WITH created AS (
-                  SELECT "taskId", MIN("createdAt") AS c_at
-                  FROM "TaskEvent"
-                  WHERE type='TASK_CREATED' AND "createdAt" >= %s AND "createdAt" < %s AND "userId" = %s
-                  GROUP BY "taskId"
-                ),
-                completed AS (
-                  SELECT "taskId", MIN("createdAt") AS d_at
-                  FROM "TaskEvent"
-                  WHERE type='TASK_COMPLETED' AND "createdAt" >= %s AND "createdAt" < %s AND "userId" = %s
-                  GROUP BY "taskId"
-                )
-                SELECT AVG(EXTRACT(EPOCH FROM (completed.d_at - created.c_at))/3600.0)::float
-                FROM created
-                JOIN completed USING ("taskId")
-                """,
-                (start, end, user_id, start, end, user_id),
-            )
-            avg_lag = cur.fetchone()[0]
-            avg_lag = float(avg_lag or 0.0)
+            # Completion lag from the task timing index (covers tasks created on earlier days)
+            lag_sum, lag_count, lag_sketch = claimed.get(user_id, (0.0, 0, None))
+            lag_sketch = lag_sketch or empty()
+            avg_lag = (lag_sum / lag_count) if lag_count > 0 else 0.0
 
-            # Created time buckets
-            cur.execute(
-                """
-                SELECT EXTRACT(HOUR FROM "createdAt")::int AS hour, COUNT(*)::int
-                FROM "TaskEvent"
-                WHERE type='TASK_CREATED' AND "createdAt" >= %s AND "createdAt" < %s AND "userId" = %s
-                GROUP BY hour
-                """,
-                (start, end, user_id),
-            )
-            buckets = {"morning": 0, "afternoon": 0, "evening": 0, "night": 0}
-            for hour, cnt in cur.fetchall():
-                buckets[bucket_hour(int(hour))] += int(cnt)
+            buckets = buckets_by_user.get(user_id, {"morning": 0, "afternoon": 0, "evening": 0, "night": 0})
+
+            features[user_id] = {
+                "createdCount": created_count,
+                "completedCount": completed_count,
+                "completionRate": completion_rate,
+                "overdueCount": overdue_count,
+                "avgCompletionLagH": avg_lag,
+                "completionLagSumH": lag_sum,
+                "completionLagCount": lag_count,
+                "completionLagSketch": lag_sketch,
+                "createdMorning": buckets["morning"],
+                "createdAfternoon": buckets["afternoon"],
+                "createdEvening": buckets["evening"],
+                "createdNight": buckets["night"],
+            }
 
             cur.execute(
                 """
@@ -105,10 +108,10 @@ def compute_for_day(conn, day: date):
                   "userId", day,
                   "createdCount", "completedCount", "completionRate",
                   "tasksWithDueAt", "overdueCount",
-                  "avgCompletionLagH",
+                  "avgCompletionLagH", "completionLagSumH", "completionLagCount", "completionLagSketch",
                   "createdMorning", "createdAfternoon", "createdEvening", "createdNight"
                 )
-                VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+                VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
                 ON CONFLICT ("userId", day)
                 DO UPDATE SET
                   "createdCount" = EXCLUDED."createdCount",
@@ -116,31 +119,58 @@ def compute_for_day(conn, day: date):
                   "completionRate" = EXCLUDED."completionRate",
                   "tasksWithDueAt" = EXCLUDED."tasksWithDueAt",
                   "overdueCount" = EXCLUDED."overdueCount",
-                  "avgCompletionLagH" = EXCLUDED."avgCompletionLagH",
+                  "avgCompletionLagH" = CASE
+                    WHEN "DailyUserFeatures"."completionLagCount" + EXCLUDED."completionLagCount" > 0
+                    THEN ("DailyUserFeatures"."completionLagSumH" + EXCLUDED."completionLagSumH")
+                         / ("DailyUserFeatures"."completionLagCount" + EXCLUDED."completionLagCount")
+                    ELSE 0 END,
+                  "completionLagSumH" = "DailyUserFeatures"."completionLagSumH" + EXCLUDED."completionLagSumH",
+                  "completionLagCount" = "DailyUserFeatures"."completionLagCount" + EXCLUDED."completionLagCount",
+                  "completionLagSketch" = ARRAY(
+                    SELECT COALESCE(a, 0) + COALESCE(b, 0)
+                    FROM unnest("DailyUserFeatures"."completionLagSketch", EXCLUDED."completionLagSketch")
+                      WITH ORDINALITY AS u(a, b, i)
+                    ORDER BY i
+                  ),
                   "createdMorning" = EXCLUDED."createdMorning",
                   "createdAfternoon" = EXCLUDED."createdAfternoon",
                   "createdEvening" = EXCLUDED."createdEvening",
                   "createdNight" = EXCLUDED."createdNight",
                   "updatedAt" = now()
+                RETURNING "avgCompletionLagH", "completionLagSumH", "completionLagCount", "completionLagSketch"
                 """,
                 (
                     str(uuid.uuid4()),
                     user_id, start,
                     created_count, completed_count, completion_rate,
                     tasks_with_due, overdue_count,
-                    avg_lag,
+                    avg_lag, lag_sum, lag_count, lag_sketch,
                     buckets["morning"], buckets["afternoon"], buckets["evening"], buckets["night"],
                 ),
             )
+            # the day's totals (realtime folds + this run's claims), for the next stages
+            avg_lag, lag_sum, lag_count, lag_sketch = cur.fetchone()
+            features[user_id].update({
+                "avgCompletionLagH": float(avg_lag or 0.0),
+                "completionLagSumH": float(lag_sum or 0.0),
+                "completionLagCount": int(lag_count or 0),
+                "completionLagSketch": list(lag_sketch or empty()),
+            })
 
         conn.commit()
 
     print(f"[features] done for {day.isoformat()} users={len(rows)}")
+    return features
 
 def main():
     today = datetime.now(timezone.utc).date()
     with psycopg.connect(DATABASE_URL) as conn:
-        compute_for_day(conn, today)
+        router = open_read_router(conn)
+        try:
+            compute_for_day(conn, today, read_conn=router.reader())
+        finally:
+            router.close()
 
 if __name__ == "__main__":
+    exit_if_check("features")
     main()
@@ -4,6 +4,9 @@ from datetime import datetime, timezone, timedelta, date
 import psycopg
 from dotenv import load_dotenv
 
+from event_rollup import compact, day_counts
+from startup import exit_if_check
+
 load_dotenv()
 
 DATABASE_URL = os.environ["DATABASE_URL"]
@@ -11,30 +14,22 @@ DATABASE_URL = os.environ["DATABASE_URL"]
 def utc_day_start(d: date) -> datetime:
     return datetime(d.year, d.month, d.day, tzinfo=timezone.utc)
 
-def compute_for_day(conn, day: date):
+def compute_for_day(conn, day: date) -> dict:
+    """Returns userId -> (createdCount, completedCount) for the day."""
     start = utc_day_start(day)
     end = start + timedelta(days=1)
 
     with conn.cursor() as cur:
-        # Counts per user for the day
-        cur.execute(
-            """
-            SELECT "userId",
-                   COUNT(*) FILTER (WHERE type = 'TASK_CREATED') AS created_count,
-                   COUNT(*) FILTER (WHERE type = 'TASK_COMPLETED') AS completed_count
-            FROM "TaskEvent"
-            WHERE "createdAt" >= %s AND "createdAt" < %s
-            GROUP BY "userId"
-            """,
-            (start, end),
-        )
-
-        rows = cur.fetchall()
+        # Counts per user for the day, from the hourly rollup
+        compact(cur)
+        rows = day_counts(cur, start, end)
+        counts = {}
 
         for user_id, created_count, completed_count in rows:
             created_count = int(created_count or 0)
             completed_count = int(completed_count or 0)
             completion_rate = (completed_count / created_count) if created_count > 0 else 0.0
+            counts[user_id] = (created_count, completed_count)
 
             # Upsert into DailyUserStats
             cur.execute(
@@ -54,6 +49,7 @@ def compute_for_day(conn, day: date):
         conn.commit()
 
     print(f"[daily-stats] done for {day.isoformat()} users={len(rows)}")
+    return counts
 
 def main():
     # default: day in UTC
@@ -63,4 +59,5 @@ def main():
         compute_for_day(conn, today)
 
 if __name__ == "__main__":
+    exit_if_check("daily-stats")
     main()
@@ -0,0 +1,116 @@
+"""
+Primary / read-replica routing for the workers.
+
+DATABASE_URL is the primary and takes all writes. When DATABASE_READ_URL is set,
+heavy analytical reads go to that replica, as long as its replay lag stays under
+the caller's limit; otherwise they fall back to the primary.
+
+  REPLICA_MAX_LAG_SEC           lag limit for batch jobs (default 60)
+  REALTIME_REPLICA_MAX_LAG_SEC  lag limit for realtime_worker (default 5)
+"""
+import os
+import time
+
+import psycopg
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DATABASE_URL = os.environ["DATABASE_URL"]
+DATABASE_READ_URL = os.environ.get("DATABASE_READ_URL")
+REPLICA_MAX_LAG_SEC = float(os.environ.get("REPLICA_MAX_LAG_SEC", "60"))
+REALTIME_REPLICA_MAX_LAG_SEC = float(os.environ.get("REALTIME_REPLICA_MAX_LAG_SEC", "5"))
+
+LAG_CHECK_EVERY_SEC = 5.0
+
+
+def sqlalchemy_url(url: str) -> str:
+    # workers use psycopg (v3) everywhere, including under SQLAlchemy
+    if url.startswith("postgresql://"):
+        return "postgresql+psycopg://" + url[len("postgresql://"):]
+    return url
+
+
+def replica_lag_seconds(conn) -> float:
+    """Replay lag of a standby; 0 on a primary or when the standby has replayed everything it received."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT CASE
+              WHEN NOT pg_is_in_recovery() THEN 0
+              WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+              ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+            END::float
+            """
+        )
+        return float(cur.fetchone()[0])
+
+
+class ReadRouter:
+    """Hands out the replica connection while its lag is under max_lag_sec, else the primary."""
+
+    __slots__ = ("primary", "replica", "max_lag_sec", "_checked_at", "_fresh")
+
+    def __init__(self, primary, replica=None, max_lag_sec: float = REPLICA_MAX_LAG_SEC):
+        self.primary = primary
+        self.replica = replica
+        self.max_lag_sec = max_lag_sec
+        self._checked_at = float("-inf")
+        self._fresh = False
+
+    def reader(self):
+        if self.replica is None or self.replica.broken:
+            return self.primary
+
+        now = time.monotonic()
+        if now - self._checked_at >= LAG_CHECK_EVERY_SEC:
+            self._checked_at = now
+            try:
+                lag = replica_lag_seconds(self.replica)
+                fresh = lag <= self.max_lag_sec
+            except psycopg.Error as e:
+                print("[db] replica lag check failed, using primary:", str(e))
+                fresh = False
+            if fresh != self._fresh:
+                print(f"[db] reads -> {'replica' if fresh else 'primary'}")
+            self._fresh = fresh
+
+        return self.replica if self._fresh else self.primary
+
+    def close(self):
+        if self.replica is not None:
+            self.replica.close()
+
+
+def open_read_router(primary, max_lag_sec: float = REPLICA_MAX_LAG_SEC) -> ReadRouter:
+    replica = None
+    if DATABASE_READ_URL:
+        try:
+            # autocommit: read-only queries should not hold a snapshot open on the standby
+            replica = psycopg.connect(DATABASE_READ_URL, autocommit=True)
+        except psycopg.Error as e:
+            print("[db] replica unavailable, using primary:", str(e))
+    return ReadRouter(primary, replica, max_lag_sec)
+
+
+def read_engine(primary_engine, max_lag_sec: float = REPLICA_MAX_LAG_SEC, **engine_kwargs):
+    """SQLAlchemy engine for analytical reads: the replica if configured and fresh enough, else primary_engine."""
+    if not DATABASE_READ_URL:
+        return primary_engine
+
+    from sqlalchemy import create_engine
+
+    engine = create_engine(sqlalchemy_url(DATABASE_READ_URL), **engine_kwargs)
+    try:
+        with engine.connect() as c:
+            lag = replica_lag_seconds(c.connection.driver_connection)
+    except Exception as e:
+        print("[db] replica unavailable, using primary:", str(e))
+        engine.dispose()
+        return primary_engine
+
+    if lag > max_lag_sec:
+        print(f"[db] replica lag {lag:.1f}s > {max_lag_sec}s, using primary")
+        engine.dispose()
+        return primary_engine
+    return engine
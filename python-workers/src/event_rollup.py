@@ -0,0 +1,137 @@
+"""
+Hourly TaskEvent rollup: (userId, hour, type) -> count, firstAt, lastAt in "TaskEventHourly".
+
+compact() is incremental: it re-aggregates from one hour before its watermark
+("RollupWatermark") up to now, replacing counts, so reruns are idempotent and late
+rows inside that window are picked up. The realtime worker refreshes single (user, hour) rows as
+events arrive; daily_stats and daily_features read at most 24 rows per user-type.
+
+Run standalone (e.g. hourly cron):
+  python src/event_rollup.py
+"""
+import os
+from datetime import datetime, timezone, timedelta
+
+import psycopg
+from dotenv import load_dotenv
+
+from startup import exit_if_check
+
+load_dotenv()
+DATABASE_URL = os.environ["DATABASE_URL"]
+
+WATERMARK_NAME = "TaskEventHourly"
+COMPACT_OVERLAP = timedelta(hours=1)
+
+
+def hour_start(dt: datetime) -> datetime:
+    """Start of the UTC hour (naive values are UTC, as stored); rows are keyed by UTC hour."""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def rollup_range(cur, start: datetime, end: datetime, user_id: str = None) -> int:
+    user_filter = 'AND "userId" = %(user_id)s' if user_id else ""
+    cur.execute(
+        f"""
+        INSERT INTO "TaskEventHourly" ("userId", hour, type, count, "firstAt", "lastAt")
+        SELECT "userId", date_trunc('hour', "createdAt"), type, COUNT(*)::int, MIN("createdAt"), MAX("createdAt")
+        FROM "TaskEvent"
+        WHERE "createdAt" >= %(start)s AND "createdAt" < %(end)s {user_filter}
+        GROUP BY 1, 2, 3
+        ON CONFLICT ("userId", hour, type)
+        DO UPDATE SET
+          count = EXCLUDED.count,
+          "firstAt" = EXCLUDED."firstAt",
+          "lastAt" = EXCLUDED."lastAt"
+        """,
+        {"start": start, "end": end, "user_id": user_id},
+    )
+    return cur.rowcount
+
+
+def compact(cur, now: datetime = None) -> int:
+    now = now or datetime.now(timezone.utc)
+    # own watermark: realtime per-user refreshes must not advance the global position
+    cur.execute('SELECT watermark FROM "RollupWatermark" WHERE name = %s', (WATERMARK_NAME,))
+    row = cur.fetchone()
+    if row:
+        start = row[0] - COMPACT_OVERLAP
+    else:
+        cur.execute('SELECT MIN("createdAt") FROM "TaskEvent"')
+        oldest = cur.fetchone()[0]
+        if oldest is None:
+            return 0
+        start = hour_start(oldest)
+
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    n = rollup_range(cur, start, now + timedelta(seconds=1))
+
+    cur.execute(
+        """
+        INSERT INTO "RollupWatermark" (name, watermark, "updatedAt")
+        VALUES (%s, %s, now())
+        ON CONFLICT (name) DO UPDATE SET watermark = EXCLUDED.watermark, "updatedAt" = now()
+        """,
+        (WATERMARK_NAME, hour_start(now)),
+    )
+    return n
+
+
+def day_counts(cur, start: datetime, end: datetime) -> list:
+    """(userId, createdCount, completedCount) rows for [start, end)."""
+    cur.execute(
+        """
+        SELECT "userId",
+               COALESCE(SUM(count) FILTER (WHERE type = 'TASK_CREATED'), 0)::int,
+               COALESCE(SUM(count) FILTER (WHERE type = 'TASK_COMPLETED'), 0)::int
+        FROM "TaskEventHourly"
+        WHERE hour >= %s AND hour < %s
+        GROUP BY "userId"
+        """,
+        (start, end),
+    )
+    return cur.fetchall()
+
+
+def created_by_hour(cur, start: datetime, end: datetime, user_id: str = None) -> list:
+    """(userId, hour of day, created count) rows for [start, end)."""
+    user_filter = 'AND "userId" = %s' if user_id else ""
+    params = (start, end, user_id) if user_id else (start, end)
+    cur.execute(
+        f"""
+        SELECT "userId", EXTRACT(HOUR FROM hour)::int, count
+        FROM "TaskEventHourly"
+        WHERE type = 'TASK_CREATED' AND hour >= %s AND hour < %s {user_filter}
+        """,
+        params,
+    )
+    return cur.fetchall()
+
+
+def user_day_rows(cur, user_id: str, start: datetime, end: datetime) -> list:
+    """(type, hour of day, count) rows for one user in [start, end): at most 24 per type."""
+    cur.execute(
+        """
+        SELECT type, EXTRACT(HOUR FROM hour)::int, count
+        FROM "TaskEventHourly"
+        WHERE "userId" = %s AND hour >= %s AND hour < %s
+        """,
+        (user_id, start, end),
+    )
+    return cur.fetchall()
+
+
+def main():
+    with psycopg.connect(DATABASE_URL) as conn:
+        with conn.cursor() as cur:
+            n = compact(cur)
+        conn.commit()
+    print(f"[rollup] compacted rows={n}")
+
+
+if __name__ == "__main__":
+    exit_if_check("rollup")
+    main()
@@ -0,0 +1,122 @@
+"""
+Stream entry decoding for timeflow.events (see docs/EVENTS_CONTRACT.md).
+
+v1 entries carry one event as string fields; v2 entries carry several events in
+a compact positional encoding. Both decode into the same Event type so workers
+can consume a mixed stream.
+"""
+from datetime import datetime, timezone
+from functools import lru_cache
+
+V2_FIELD_SEP = "\t"
+V2_RECORD_SEP = "\n"
+MS_PER_DAY = 86_400_000
+
+
+class Event:
+    __slots__ = ("event_id", "type", "user_id", "task_id", "created_at", "day_start")
+
+    def __init__(self, event_id, type, user_id, task_id, created_at, day_start):
+        self.event_id = event_id
+        self.type = type
+        self.user_id = user_id
+        self.task_id = task_id
+        self.created_at = created_at
+        self.day_start = day_start
+
+    def to_v1_fields(self) -> dict:
+        fields = {
+            "version": "1",
+            "eventId": self.event_id or "",
+            "type": self.type,
+            "userId": self.user_id,
+            "createdAt": self.created_at.isoformat(timespec="milliseconds").replace("+00:00", "Z"),
+        }
+        if self.task_id:
+            fields["taskId"] = self.task_id
+        return fields
+
+
+def parse_iso(s: str) -> datetime:
+    # "2026-01-14T14:20:57.153Z"
+    if s.endswith("Z"):
+        s = s[:-1] + "+00:00"
+    return datetime.fromisoformat(s)
+
+
+@lru_cache(maxsize=64)
+def _day_start_for_epoch_day(epoch_day: int) -> datetime:
+    return datetime.fromtimestamp(epoch_day * 86_400, tz=timezone.utc)
+
+
+def day_start_for(dt: datetime) -> datetime:
+    return _day_start_for_epoch_day(int(dt.timestamp() // 86_400))
+
+
+def _decode_v1(fields: dict) -> Event:
+    created_at = parse_iso(fields["createdAt"])
+    return Event(
+        fields.get("eventId"),
+        fields.get("type", "UNKNOWN"),
+        fields["userId"],
+        fields.get("taskId") or None,
+        created_at,
+        day_start_for(created_at),
+    )
+
+
+def _decode_v2(fields: dict) -> list:
+    count = int(fields["count"])
+    out = []
+    for record in fields.get("events", "").split(V2_RECORD_SEP):
+        if not record:
+            continue
+        event_id, event_type, user_id, task_id, created_ms = record.split(V2_FIELD_SEP)
+        ms = int(created_ms)
+        out.append(Event(
+            event_id or None,
+            event_type,
+            user_id,
+            task_id or None,
+            datetime.fromtimestamp(ms / 1000.0, tz=timezone.utc),
+            _day_start_for_epoch_day(ms // MS_PER_DAY),
+        ))
+    if len(out) != count:
+        # a truncated "events" field can still split into whole records
+        raise ValueError(f"v2 entry has {len(out)} events, count says {count}")
+    return out
+
+
+def decode_entry(fields: dict):
+    """
+    Returns the events in a stream entry, or None for an unknown version.
+    Raises KeyError/ValueError for a malformed entry; workers dead-letter it (retrying cannot fix it).
+    """
+    version = fields.get("version", "1")
+    if version == "1":
+        return [_decode_v1(fields)]
+    if version == "2":
+        return _decode_v2(fields)
+    return None
+
+
+def encode_v2_fields(events) -> dict:
+    # same layout as the Node publisher's v2 batches
+    records = V2_RECORD_SEP.join(
+        V2_FIELD_SEP.join((
+            ev.event_id or "",
+            ev.type,
+            ev.user_id,
+            ev.task_id or "",
+            str(round(ev.created_at.timestamp() * 1000)),
+        ))
+        for ev in events
+    )
+    return {"version": "2", "count": str(len(events)), "events": records}
+
+
+def dlq_entries(msg_id: str, fields: dict, events, error: str) -> list:
+    # v2 entries are split back into v1-shaped DLQ entries so replay tooling stays per-event
+    if fields.get("version") == "2" and events:
+        return [{"msgId": msg_id, **ev.to_v1_fields(), "error": error} for ev in events]
+    return [{"msgId": msg_id, **fields, "error": error}]
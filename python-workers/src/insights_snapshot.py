@@ -0,0 +1,178 @@
+"""
+Per-user insights snapshots in Redis, served by GET /insights and /analytics/summary.
+
+Workers write a ready-to-serve JSON document after feature/segment/recommendation
+updates; the API serves it when present, and on a miss builds the same document
+from Postgres and caches it. The shape mirrors the API responses (see
+server/src/modules/insights/insights.snapshot.ts).
+
+Task mutations in the API INCR a per-user generation key and delete the snapshot.
+Writers read the generation before building and SET only if it is unchanged, so
+a snapshot built from pre-mutation rows is dropped instead of cached. The TTL
+bounds staleness of worker-maintained fields (segment, features, recommendations)
+that change without an API call.
+"""
+import json
+import time
+from datetime import datetime, timezone
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_KEY_PREFIX = "timeflow:insights:v1:"
+SNAPSHOT_GEN_PREFIX = "timeflow:insights:gen:"
+SNAPSHOT_TTL_SEC = 600
+SNAPSHOT_DEBOUNCE_SEC = 2.0
+
+# same script as the API's writeInsightsSnapshot
+SET_IF_GENERATION_LUA = """
+local gen = redis.call('GET', KEYS[2]) or ''
+if gen ~= ARGV[1] then return 0 end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+
+def snapshot_key(user_id: str) -> str:
+    return f"{SNAPSHOT_KEY_PREFIX}{user_id}"
+
+
+def snapshot_generation_key(user_id: str) -> str:
+    return f"{SNAPSHOT_GEN_PREFIX}{user_id}"
+
+
+def _iso(v):
+    if v is None:
+        return None
+    if v.tzinfo is None:
+        # Prisma stores TIMESTAMP(3) without zone, in UTC
+        v = v.replace(tzinfo=timezone.utc)
+    return v.astimezone(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+def _row_dict(cur, row):
+    if row is None:
+        return None
+    out = {}
+    for col, v in zip((d.name for d in cur.description), row):
+        out[col] = _iso(v) if isinstance(v, datetime) else v
+    return out
+
+
+def build_snapshot(cur, user_id: str) -> dict:
+    now = datetime.now(timezone.utc)
+
+    cur.execute(
+        """
+        SELECT
+          COUNT(*)::int,
+          COUNT(*) FILTER (WHERE status = 'DONE')::int,
+          COUNT(*) FILTER (WHERE status = 'PENDING')::int,
+          COUNT(*) FILTER (WHERE status = 'CANCELED')::int,
+          COUNT(*) FILTER (WHERE status = 'PENDING' AND "dueAt" < %s)::int
+        FROM "Task"
+        WHERE "userId" = %s
+        """,
+        (now, user_id),
+    )
+    total, done, pending, canceled, overdue = cur.fetchone()
+
+    cur.execute(
+        'SELECT segment, label, "updatedAt", "featuresRef" FROM "UserSegment" WHERE "userId" = %s',
+        (user_id,),
+    )
+    segment = _row_dict(cur, cur.fetchone())
+
+    cur.execute(
+        """
+        SELECT day, "createdCount", "completedCount", "completionRate", "updatedAt"
+        FROM "DailyUserStats"
+        WHERE "userId" = %s
+        ORDER BY day DESC
+        LIMIT 1
+        """,
+        (user_id,),
+    )
+    latest_stats = _row_dict(cur, cur.fetchone())
+
+    cur.execute(
+        'SELECT * FROM "DailyUserFeatures" WHERE "userId" = %s ORDER BY day DESC LIMIT 1',
+        (user_id,),
+    )
+    latest_features = _row_dict(cur, cur.fetchone())
+
+    cur.execute(
+        """
+        SELECT id, message, evidence, "expiresAt", "updatedAt"
+        FROM "UserRecommendation"
+        WHERE "userId" = %s
+        ORDER BY "createdAt" DESC
+        LIMIT 5
+        """,
+        (user_id,),
+    )
+    recommendations = [_row_dict(cur, row) for row in cur.fetchall()]
+
+    return {
+        "version": SNAPSHOT_VERSION,
+        "userId": user_id,
+        "generatedAt": _iso(now),
+        "taskSummary": {
+            "total": total,
+            "done": done,
+            "pending": pending,
+            "canceled": canceled,
+            "overdue": overdue,
+            "completionRate": round(done / total, 3) if total > 0 else 0,
+        },
+        "segment": segment,
+        "latestDailyStats": latest_stats,
+        "latestDailyFeatures": latest_features,
+        "recommendations": recommendations,
+    }
+
+
+def write_snapshots(r, conn, user_ids) -> int:
+    """Returns the number of snapshots stored (users invalidated while building are skipped)."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return 0
+
+    # generations must be read before the rows the snapshots are built from
+    generations = r.mget([snapshot_generation_key(u) for u in user_ids])
+
+    with conn.cursor() as cur:
+        snapshots = [build_snapshot(cur, user_id) for user_id in user_ids]
+    # read-only queries; end the transaction so the connection is not left idle in one
+    conn.commit()
+
+    set_if_generation = r.register_script(SET_IF_GENERATION_LUA)
+    pipe = r.pipeline(transaction=False)
+    for snap, gen in zip(snapshots, generations):
+        set_if_generation(
+            keys=[snapshot_key(snap["userId"]), snapshot_generation_key(snap["userId"])],
+            args=[gen or "", json.dumps(snap), SNAPSHOT_TTL_SEC],
+            client=pipe,
+        )
+    return sum(int(ok) for ok in pipe.execute())
+
+
+class SnapshotDebouncer:
+    """Coalesces per-user updates: a user is due once SNAPSHOT_DEBOUNCE_SEC passed since it first became dirty."""
+
+    __slots__ = ("delay", "_dirty")
+
+    def __init__(self, delay: float = SNAPSHOT_DEBOUNCE_SEC):
+        self.delay = delay
+        self._dirty = {}
+
+    def __len__(self):
+        return len(self._dirty)
+
+    def mark(self, user_id: str):
+        self._dirty.setdefault(user_id, time.monotonic())
+
+    def pop_due(self) -> list:
+        now = time.monotonic()
+        due = [u for u, since in self._dirty.items() if now - since >= self.delay]
+        for u in due:
+            del self._dirty[u]
+        return due
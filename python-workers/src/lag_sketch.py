@@ -0,0 +1,50 @@
+"""
+Fixed-size, mergeable completion-lag sketch (log-bucketed histogram).
+
+Stored per user-day in DailyUserFeatures."completionLagSketch" as an int[] of
+SKETCH_SIZE counts. Bucket 0 holds lags <= MIN_LAG_H; bucket i >= 1 holds lags in
+(MIN_LAG_H * GAMMA^(i-1), MIN_LAG_H * GAMMA^i]; the last bucket also takes overflow.
+Merging is element-wise addition, so a 30-day window is an O(days) merge and
+quantiles are within ~12% relative error.
+"""
+import math
+
+MIN_LAG_H = 1.0 / 60.0  # one minute
+GAMMA = 1.25
+SKETCH_SIZE = 56        # covers up to ~90 days
+
+_LOG_GAMMA = math.log(GAMMA)
+
+def empty() -> list:
+    return [0] * SKETCH_SIZE
+
+
+def bucket_index(lag_h: float) -> int:
+    if lag_h <= MIN_LAG_H:
+        return 0
+    return min(SKETCH_SIZE - 1, math.ceil(math.log(lag_h / MIN_LAG_H) / _LOG_GAMMA))
+
+
+def merge(sketches) -> list:
+    out = empty()
+    for s in sketches:
+        if not s:
+            continue
+        for i, c in enumerate(s[:SKETCH_SIZE]):
+            if c:
+                out[i] += int(c)
+    return out
+
+
+def quantile(sketch, q: float) -> float:
+    total = sum(c or 0 for c in sketch)
+    if total == 0:
+        return 0.0
+    rank = q * (total - 1)
+    seen = 0
+    for i, c in enumerate(sketch):
+        seen += c or 0
+        if seen > rank:
+            # geometric midpoint of the bucket
+            return 0.0 if i == 0 else MIN_LAG_H * GAMMA ** (i - 0.5)
+    return MIN_LAG_H * GAMMA ** (SKETCH_SIZE - 1.5)
@@ -0,0 +1,175 @@
+"""
+Nightly batch pipeline: runs daily_stats, daily_features, recommendations_v1 and
+cluster_users in dependency order inside one process, then refreshes the
+per-user insights snapshots in Redis.
+
+All stages share one SQLAlchemy connection pool for the primary and, when
+DATABASE_READ_URL is set and fresh enough, one for the replica. Per-user aggregates are handed
+from stage to stage in memory instead of being re-read from the tables the
+previous stage just wrote. Independent stages run in parallel.
+
+Usage:
+  python src/pipeline.py                 # all stages, up to 2 in parallel
+  python src/pipeline.py --max-workers 1 # serial
+  python src/pipeline.py --check         # import/config check only
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import redis
+from dotenv import load_dotenv
+
+import daily_stats
+import daily_features
+import recommendations_v1
+import cluster_users
+from db import read_engine, sqlalchemy_url
+from insights_snapshot import write_snapshots
+from startup import run_check
+
+load_dotenv()
+# stages use psycopg (v3) cursors on the pooled connections
+SQLALCHEMY_DATABASE_URL = sqlalchemy_url(os.environ.get("SQLALCHEMY_DATABASE_URL", os.environ["DATABASE_URL"]))
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+
+
+@contextmanager
+def pooled_conn(engine):
+    # DBAPI (psycopg) connection checked out from the shared pool
+    conn = engine.raw_connection()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+@contextmanager
+def pooled_read_conn(conn, reader):
+    # replica connection from the shared read pool; without a (fresh) replica, the stage's own connection
+    if reader is None:
+        yield conn
+        return
+    with pooled_conn(reader) as read_conn:
+        yield read_conn
+
+
+def run_daily_stats(engine, reader, day, results):
+    with pooled_conn(engine) as conn:
+        return daily_stats.compute_for_day(conn, day)
+
+
+def run_daily_features(engine, reader, day, results):
+    with pooled_conn(engine) as conn, pooled_read_conn(conn, reader) as read_conn:
+        return daily_features.compute_for_day(conn, day, counts=results["daily_stats"], read_conn=read_conn)
+
+
+def run_recommendations(engine, reader, day, results):
+    with pooled_conn(engine) as conn, pooled_read_conn(conn, reader) as read_conn:
+        return recommendations_v1.generate(
+            conn, today_stats=results["daily_stats"], read_conn=read_conn, today_features=results["daily_features"]
+        )
+
+
+def run_cluster_users(engine, reader, day, results):
+    return cluster_users.main(engine=engine, features_today=results["daily_features"], reader=reader or engine)
+
+
+def run_insights_snapshots(engine, reader, day, results):
+    user_ids = set(results["daily_stats"]) | set(results["cluster_users"] or ())
+    r = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+    try:
+        with pooled_conn(engine) as conn:
+            n = write_snapshots(r, conn, sorted(user_ids))
+    finally:
+        r.close()
+    print(f"[pipeline] insights snapshots written users={n}")
+    return n
+
+
+# stage -> (dependencies, runner)
+STAGES = {
+    "daily_stats": ((), run_daily_stats),
+    "daily_features": (("daily_stats",), run_daily_features),
+    # reads today's completion-lag sketches from daily_features' results
+    "recommendations": (("daily_stats", "daily_features"), run_recommendations),
+    "cluster_users": (("daily_features",), run_cluster_users),
+    "insights_snapshots": (("recommendations", "cluster_users"), run_insights_snapshots),
+}
+
+
+def run_pipeline(engine, max_workers: int = 2, reader=None) -> dict:
+    """
+    Returns stage -> (status, seconds). status is ok, failed or skipped.
+    reader is the replica engine for analytical reads (None: read from engine).
+    """
+    day = datetime.now(timezone.utc).date()
+    results = {}
+    report = {}
+    remaining = dict(STAGES)
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while remaining or running:
+            for name, (deps, fn) in list(remaining.items()):
+                if any(report.get(d, ("",))[0] in ("failed", "skipped") for d in deps):
+                    report[name] = ("skipped", 0.0)
+                    del remaining[name]
+                elif all(d in results for d in deps):
+                    print(f"[pipeline] start {name}", flush=True)
+                    running[pool.submit(fn, engine, reader, day, results)] = (name, time.perf_counter())
+                    del remaining[name]
+
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                name, started = running.pop(fut)
+                took = time.perf_counter() - started
+                try:
+                    results[name] = fut.result()
+                    report[name] = ("ok", took)
+                except Exception as e:
+                    report[name] = ("failed", took)
+                    print(f"[pipeline] {name} failed: {e}", flush=True)
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the nightly batch jobs as one pipeline")
+    parser.add_argument("--max-workers", type=int, default=2, help="stages to run in parallel")
+    parser.add_argument("--check", action="store_true", help="import stages and config, then exit without connecting")
+    args = parser.parse_args()
+    if args.check:
+        run_check("pipeline", cluster_users.LAZY_DEPS)
+    max_workers = max(1, args.max_workers)
+
+    from sqlalchemy import create_engine
+
+    engine = create_engine(SQLALCHEMY_DATABASE_URL, pool_size=max_workers, max_overflow=0)
+    # one pool for the replica too; read_engine falls back to engine when it is missing or lagging
+    reader = read_engine(engine, pool_size=max_workers, max_overflow=0)
+    started = time.perf_counter()
+    try:
+        report = run_pipeline(engine, max_workers, reader=reader if reader is not engine else None)
+    finally:
+        if reader is not engine:
+            reader.dispose()
+        engine.dispose()
+
+    for name, (status, took) in report.items():
+        print(f"[pipeline] {name:<16} {status:<8} {took:.2f}s")
+    print(f"[pipeline] total {time.perf_counter() - started:.2f}s")
+
+    if any(status != "ok" for status, _ in report.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 """
 Realtime features worker: consumes from Redis Streams, updates DailyUserFeatures and UserSegment.
-Consumer group: realtime-features. See docs/EVENTS_CONTRACT.md for event format.
+Consumer group: realtime-features. See docs/EVENTS_CONTRACT.md for event format (v1 and v2 entries).
 """
 import os
 import json
@@ -11,9 +11,15 @@ import redis
 import psycopg
 import time
 from dotenv import load_dotenv
-import numpy as np
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
+
+from db import ReadRouter, open_read_router, REALTIME_REPLICA_MAX_LAG_SEC
+from lag_sketch import merge as merge_sketches, quantile
+from segment_model import load_latest as load_segment_model, nearest_segment
+from insights_snapshot import SnapshotDebouncer, write_snapshots, SNAPSHOT_DEBOUNCE_SEC
+from event_rollup import rollup_range, user_day_rows, hour_start
+from events import Event, decode_entry, dlq_entries
+from startup import exit_if_check
+from task_timing import index_task_created, claim_completion, fold_completion_lag, lag_hours
 
 load_dotenv()
 
@@ -38,10 +44,6 @@ PRUNE_INTERVAL_SEC = 60
 MAX_RETRIES = 5
 ATTEMPTS_TTL_SEC = 3600
 
-def utc_day_start(dt: datetime) -> datetime:
-    d = dt.date()
-    return datetime(d.year, d.month, d.day, tzinfo=timezone.utc)
-
 def ensure_group(r: redis.Redis):
     try:
         r.xgroup_create(STREAM, GROUP, id="0-0", mkstream=True)
@@ -50,31 +52,24 @@ def ensure_group(r: redis.Redis):
             return
         raise
 
-def parse_iso(s: str) -> datetime:
-    # "2026-01-14T14:20:57.153Z"
-    if s.endswith("Z"):
-        s = s[:-1] + "+00:00"
-    return datetime.fromisoformat(s)
-
 def upsert_daily_features_for_user_day(conn, user_id: str, day_start: datetime):
+    # completion lag columns are maintained incrementally by fold_completion_lag
     day_end = day_start + timedelta(days=1)
     now = datetime.now(timezone.utc)
 
     with conn.cursor() as cur:
-        # counts from TaskEvent in that day
-        cur.execute(
-            """
-            SELECT
-              COUNT(*) FILTER (WHERE type='TASK_CREATED')::int AS created_count,
-              COUNT(*) FILTER (WHERE type='TASK_COMPLETED')::int AS completed_count
-            FROM "TaskEvent"
-            WHERE "userId" = %s AND "createdAt" >= %s AND "createdAt" < %s
-            """,
-            (user_id, day_start, day_end),
-        )
-        created_count, completed_count = cur.fetchone()
-        created_count = int(created_count or 0)
-        completed_count = int(completed_count or 0)
+        # counts and created-hour buckets from the hourly rollup (refreshed in handle_events)
+        created_count = completed_count = 0
+        buckets = {"morning": 0, "afternoon": 0, "evening": 0, "night": 0}
+        for event_type, h, cnt in user_day_rows(cur, user_id, day_start, day_end):
+            if event_type == "TASK_COMPLETED":
+                completed_count += int(cnt)
+            elif event_type == "TASK_CREATED":
+                created_count += int(cnt)
+                if 5 <= h <= 11: buckets["morning"] += int(cnt)
+                elif 12 <= h <= 17: buckets["afternoon"] += int(cnt)
+                elif 18 <= h <= 23: buckets["evening"] += int(cnt)
+                else: buckets["night"] += int(cnt)
         completion_rate = (completed_count / created_count) if created_count > 0 else 0.0
 
         # due/overdue snapshot
@@ -92,46 +87,6 @@ def upsert_daily_features_for_user_day(conn, user_id: str, day_start: datetime):
         tasks_with_due = int(tasks_with_due or 0)
         overdue_count = int(overdue_count or 0)
 
-        # avg completion lag (hours)
-        cur.execute(
-            """
-            WITH created AS (
-              SELECT "taskId", MIN("createdAt") AS c_at
-              FROM "TaskEvent"
-              WHERE type='TASK_CREATED' AND "userId"=%s AND "createdAt">=%s AND "createdAt"<%s
-              GROUP BY "taskId"
-            ),
-            completed AS (
-              SELECT "taskId", MIN("createdAt") AS d_at
-              FROM "TaskEvent"
-              WHERE type='TASK_COMPLETED' AND "userId"=%s AND "createdAt">=%s AND "createdAt"<%s
-              GROUP BY "taskId"
-            )
-            SELECT AVG(EXTRACT(EPOCH FROM (completed.d_at - created.c_at))/3600.0)::float
-            FROM created JOIN completed USING ("taskId")
-            """,
-            (user_id, day_start, day_end, user_id, day_start, day_end),
-        )
-        avg_lag = float(cur.fetchone()[0] or 0.0)
-
-        # hour buckets for created
-        cur.execute(
-            """
-            SELECT EXTRACT(HOUR FROM "createdAt")::int AS hour, COUNT(*)::int
-            FROM "TaskEvent"
-            WHERE type='TASK_CREATED' AND "userId"=%s AND "createdAt">=%s AND "createdAt"<%s
-            GROUP BY hour
-            """,
-            (user_id, day_start, day_end),
-        )
-        buckets = {"morning": 0, "afternoon": 0, "evening": 0, "night": 0}
-        for hour, cnt in cur.fetchall():
-            h = int(hour)
-            if 5 <= h <= 11: buckets["morning"] += int(cnt)
-            elif 12 <= h <= 17: buckets["afternoon"] += int(cnt)
-            elif 18 <= h <= 23: buckets["evening"] += int(cnt)
-            else: buckets["night"] += int(cnt)
-
         cur.execute(
             """
             INSERT INTO "DailyUserFeatures" (
@@ -139,11 +94,10 @@ def upsert_daily_features_for_user_day(conn, user_id: str, day_start: datetime):
               "userId", day,
               "createdCount","completedCount","completionRate",
               "tasksWithDueAt","overdueCount",
-              "avgCompletionLagH",
               "createdMorning","createdAfternoon","createdEvening","createdNight",
               "updatedAt"
             )
-            VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s, now())
+            VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s, now())
             ON CONFLICT ("userId", day)
             DO UPDATE SET
               "createdCount"=EXCLUDED."createdCount",
@@ -151,7 +105,6 @@ def upsert_daily_features_for_user_day(conn, user_id: str, day_start: datetime):
               "completionRate"=EXCLUDED."completionRate",
               "tasksWithDueAt"=EXCLUDED."tasksWithDueAt",
               "overdueCount"=EXCLUDED."overdueCount",
-              "avgCompletionLagH"=EXCLUDED."avgCompletionLagH",
               "createdMorning"=EXCLUDED."createdMorning",
               "createdAfternoon"=EXCLUDED."createdAfternoon",
               "createdEvening"=EXCLUDED."createdEvening",
@@ -163,51 +116,89 @@ def upsert_daily_features_for_user_day(conn, user_id: str, day_start: datetime):
                 user_id, day_start,
                 created_count, completed_count, completion_rate,
                 tasks_with_due, overdue_count,
-                avg_lag,
                 buckets["morning"], buckets["afternoon"], buckets["evening"], buckets["night"],
             ),
         )
 
-def recompute_segment_for_user(conn, user_id: str, days: int = 30, k: int = 3):
+def load_feature_window(conn, user_id: str, start_day: datetime, read_conn=None, fresh_from: datetime = None):
+    sql = """
+        SELECT day,
+               "createdCount","completedCount","completionRate",
+               "overdueCount","avgCompletionLagH",
+               "createdMorning","createdAfternoon","createdEvening","createdNight",
+               "completionLagSumH","completionLagCount","completionLagSketch"
+        FROM "DailyUserFeatures"
+        WHERE "userId"=%s AND day >= %s {upper}
+        ORDER BY day ASC
+    """
+    if read_conn is None or read_conn is conn or fresh_from is None:
+        with conn.cursor() as cur:
+            cur.execute(sql.format(upper=""), (user_id, start_day))
+            return cur.fetchall()
+
+    # days this entry just wrote come from the primary; older days from the replica
+    with read_conn.cursor() as rcur:
+        rcur.execute(sql.format(upper="AND day < %s"), (user_id, start_day, fresh_from))
+        rows = rcur.fetchall()
+    with conn.cursor() as cur:
+        cur.execute(sql.format(upper=""), (user_id, max(start_day, fresh_from)))
+        return rows + cur.fetchall()
+
+def recompute_segment_for_user(conn, user_id: str, days: int = 30, k: int = 3, read_conn=None, fresh_from: datetime = None, model=None):
+    """
+    model: latest SegmentModel (segment_model.load_latest). The user gets the nearest model centroid's
+    segment and label, numbered as cluster_users numbers them; rules are the fallback before the first
+    cluster run. centroid stays NULL either way (the API resolves it from SegmentModel).
+    """
     end = datetime.now(timezone.utc)
     start = end - timedelta(days=days)
     start_day = datetime(start.year, start.month, start.day, tzinfo=timezone.utc)
 
-    with conn.cursor() as cur:
-        cur.execute(
-            """
-            SELECT day,
-                   "createdCount","completedCount","completionRate",
-                   "overdueCount","avgCompletionLagH",
-                   "createdMorning","createdAfternoon","createdEvening","createdNight"
-            FROM "DailyUserFeatures"
-            WHERE "userId"=%s AND day >= %s
-            ORDER BY day ASC
-            """,
-            (user_id, start_day),
-        )
-        rows = cur.fetchall()
+    rows = load_feature_window(conn, user_id, start_day, read_conn, fresh_from)
 
+    with conn.cursor() as cur:
         if not rows:
             return
 
-        # aggregate across window
-        arr = np.array([r[1:] for r in rows], dtype=float)
-        agg = np.array([
-            arr[:,0].sum(),  # createdCount
-            arr[:,1].sum(),  # completedCount
-            arr[:,2].mean(), # completionRate
-            arr[:,3].mean(), # overdueCount
-            arr[:,4].mean(), # avgCompletionLagH
-            arr[:,5].sum(),  # createdMorning
-            arr[:,6].sum(),  # createdAfternoon
-            arr[:,7].sum(),  # createdEvening
-            arr[:,8].sum(),  # createdNight
-        ], dtype=float)
-
-        # For single-user realtime, KMeans is overkill; we'll label by rules using agg.
+        # aggregate across window (at most `days` rows, plain Python)
+        sums = [float(sum(v or 0 for v in col)) for col in zip(*(r[1:10] for r in rows))]
+        n_days = len(rows)
+        lag_sum = sum(float(r[10] or 0.0) for r in rows)
+        lag_count = sum(int(r[11] or 0) for r in rows)
+        sketch = merge_sketches(r[12] for r in rows)
+        agg = [
+            sums[0],           # createdCount
+            sums[1],           # completedCount
+            sums[2] / n_days,  # completionRate
+            sums[3] / n_days,  # overdueCount
+            (lag_sum / lag_count) if lag_count > 0 else 0.0,  # completion lag, per task across the window
+            sums[5],           # createdMorning
+            sums[6],           # createdAfternoon
+            sums[7],           # createdEvening
+            sums[8],           # createdNight
+        ]
+
         created, completed, rate, overdue, lag, m, a, e, n = agg
-        if rate >= 0.7 and overdue < 1:
+        features = {
+            "createdCount": float(created),
+            "completedCount": float(completed),
+            "completionRate": float(rate),
+            "overdueCount": float(overdue),
+            "avgCompletionLagH": float(lag),
+            "createdMorning": float(m),
+            "createdAfternoon": float(a),
+            "createdEvening": float(e),
+            "createdNight": float(n),
+            "completionLagP50H": quantile(sketch, 0.5),
+            "completionLagP90H": quantile(sketch, 0.9),
+        }
+        featuresRef = {"windowDays": days, "from": start_day.isoformat(), "realtime": True}
+
+        if model is not None:
+            segment, label = nearest_segment(model, features)
+            featuresRef["model"] = model["id"]
+        # no model yet: label by rules; the first cluster run renumbers everyone anyway
+        elif rate >= 0.7 and overdue < 1:
             label = "Finisher"
             segment = 0
         elif created > 20 and rate < 0.5:
@@ -223,27 +214,15 @@ def recompute_segment_for_user(conn, user_id: str, days: int = 30, k: int = 3):
             label = "Balanced"
             segment = 4
 
-        centroid = {
-            "createdCount": float(created),
-            "completedCount": float(completed),
-            "completionRate": float(rate),
-            "overdueCount": float(overdue),
-            "avgCompletionLagH": float(lag),
-            "createdMorning": float(m),
-            "createdAfternoon": float(a),
-            "createdEvening": float(e),
-            "createdNight": float(n),
-        }
-
         cur.execute(
             """
             INSERT INTO "UserSegment" ("id", "userId", segment, label, centroid, "featuresRef", "updatedAt")
-            VALUES (%s,%s,%s,%s,%s::jsonb,%s::jsonb, now())
+            VALUES (%s,%s,%s,%s,NULL,%s::jsonb, now())
             ON CONFLICT ("userId")
             DO UPDATE SET
               segment=EXCLUDED.segment,
               label=EXCLUDED.label,
-              centroid=EXCLUDED.centroid,
+              centroid=NULL,
               "featuresRef"=EXCLUDED."featuresRef",
               "updatedAt"=now()
             """,
@@ -252,8 +231,7 @@ def recompute_segment_for_user(conn, user_id: str, days: int = 30, k: int = 3):
                 user_id,
                 segment,
                 label,
-                json.dumps(centroid),
-                json.dumps({"windowDays": days, "from": start_day.isoformat(), "realtime": True}),
+                json.dumps(featuresRef),
             ),
         )
 
@@ -268,13 +246,52 @@ def prune_dead_workers(r: redis.Redis):
         r.srem(WORKERS_SET, *dead)
         print(f"[realtime] pruned dead workers: {dead}")
 
-def handle_message(conn, fields: dict):
-    user_id = fields["userId"]
-    created_at = parse_iso(fields["createdAt"])
-    day_start = utc_day_start(created_at)
+def apply_task_timing(conn, ev: Event):
+    if not ev.task_id:
+        return
+    with conn.cursor() as cur:
+        if ev.type == "TASK_CREATED":
+            index_task_created(cur, ev.task_id, ev.user_id, ev.created_at)
+        elif ev.type == "TASK_COMPLETED":
+            task_created_at = claim_completion(cur, ev.task_id, ev.created_at)
+            if task_created_at is not None:
+                fold_completion_lag(cur, ev.user_id, ev.day_start, lag_hours(task_created_at, ev.created_at))
+
+def handle_events(conn, events: list, router: ReadRouter = None):
+    # A v2 entry can carry several events for the same user/day; recompute each once.
+    user_days = {}
+    user_hours = {}
+    for ev in events:
+        apply_task_timing(conn, ev)
+        user_days.setdefault((ev.user_id, ev.day_start), None)
+        user_hours.setdefault((ev.user_id, hour_start(ev.created_at)), None)
+
+    with conn.cursor() as cur:
+        for user_id, hour in user_hours:
+            rollup_range(cur, hour, hour + timedelta(hours=1), user_id)
 
-    upsert_daily_features_for_user_day(conn, user_id, day_start)
-    recompute_segment_for_user(conn, user_id)
+    fresh_from = {}
+    for user_id, day_start in user_days:
+        upsert_daily_features_for_user_day(conn, user_id, day_start)
+        fresh_from[user_id] = min(day_start, fresh_from.get(user_id, day_start))
+
+    with conn.cursor() as cur:
+        model = load_segment_model(cur)
+    for user_id, since in fresh_from.items():
+        recompute_segment_for_user(
+            conn, user_id, read_conn=router.reader() if router else None, fresh_from=since, model=model
+        )
+
+def flush_snapshots(r: redis.Redis, conn, debouncer: SnapshotDebouncer):
+    due = debouncer.pop_due()
+    if not due:
+        return
+    try:
+        write_snapshots(r, conn, due)
+    except Exception as e:
+        # snapshots are a cache; the API falls back to Postgres
+        conn.rollback()
+        print("[realtime] snapshot write failed", len(due), str(e))
 
 def main():
     print(f"[realtime] up consumer={CONSUMER} group={GROUP} stream={STREAM}", flush=True)
@@ -285,6 +302,8 @@ def main():
     with psycopg.connect(DATABASE_URL) as conn:
         last_hb = 0
         last_prune = 0
+        debouncer = SnapshotDebouncer()
+        router = open_read_router(conn, REALTIME_REPLICA_MAX_LAG_SEC)
         while True:
             now = time.time()
             if now - last_hb > HEARTBEAT_EVERY_SEC:
@@ -299,16 +318,36 @@ def main():
                 prune_dead_workers(r)
                 last_prune = now
 
-            resp = r.xreadgroup(GROUP, CONSUMER, {STREAM: ">"}, count=BATCH_COUNT, block=BLOCK_MS)
+            flush_snapshots(r, conn, debouncer)
+
+            block_ms = int(SNAPSHOT_DEBOUNCE_SEC * 1000) if len(debouncer) else BLOCK_MS
+            resp = r.xreadgroup(GROUP, CONSUMER, {STREAM: ">"}, count=BATCH_COUNT, block=block_ms)
             if not resp:
                 continue
 
             for stream_name, messages in resp:
                 for msg_id, kv in messages:
                     try:
-                        handle_message(conn, kv)
+                        events = decode_entry(kv)
+                    except (KeyError, ValueError) as e:
+                        # retrying cannot fix the encoding: dead-letter it right away
+                        for dlq_fields in dlq_entries(msg_id, kv, None, f"malformed entry: {e}"):
+                            r.xadd(DLQ_STREAM, dlq_fields)
+                        r.xack(STREAM, GROUP, msg_id)
+                        print("[realtime] malformed message moved to DLQ", msg_id, str(e))
+                        continue
+
+                    if events is None:
+                        print("[realtime] skipping unknown version", msg_id, kv.get("version"))
+                        r.xack(STREAM, GROUP, msg_id)
+                        continue
+
+                    try:
+                        handle_events(conn, events, router)
                         conn.commit()
                         r.xack(STREAM, GROUP, msg_id)
+                        for ev in events:
+                            debouncer.mark(ev.user_id)
                     except Exception as e:
                         conn.rollback()
                         attempts_key = f"timeflow:attempts:{msg_id}"
@@ -316,7 +355,8 @@ def main():
                         r.expire(attempts_key, ATTEMPTS_TTL_SEC)
 
                         if attempts >= MAX_RETRIES:
-                            r.xadd(DLQ_STREAM, {"msgId": msg_id, **kv, "error": str(e)})
+                            for dlq_fields in dlq_entries(msg_id, kv, events, str(e)):
+                                r.xadd(DLQ_STREAM, dlq_fields)
                             r.xack(STREAM, GROUP, msg_id)
                             print("[realtime] moved to DLQ", msg_id, str(e))
                         else:
@@ -324,4 +364,5 @@ def main():
 
 
 if __name__ == "__main__":
+    exit_if_check("realtime")
     main()
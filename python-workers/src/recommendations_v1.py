@@ -4,6 +4,10 @@ from datetime import datetime, timezone, timedelta
 import psycopg
 from dotenv import load_dotenv
 
+from db import open_read_router
+from lag_sketch import merge as merge_sketches, quantile
+from startup import exit_if_check
+
 load_dotenv()
 DATABASE_URL = os.environ["DATABASE_URL"]
 
@@ -28,72 +32,201 @@ def upsert_rec(cur, user_id: str, rec_type: str, score: float, message: str, evi
         (user_id, rec_type, score, message, psycopg.types.json.Jsonb(evidence), expires_at),
     )
 
-def main():
+def load_window(cur, start_day: datetime, today_stats: dict = None):
+    """
+    7-day aggregates per user as (userId, created, completed, avgRate) rows.
+    today_stats (userId -> (created, completed)) from daily_stats replaces today's DailyUserStats rows.
+    """
+    if today_stats is None:
+        cur.execute(
+            """
+            SELECT "userId",
+                   SUM("createdCount")::int AS created_7d,
+                   SUM("completedCount")::int AS completed_7d,
+                   AVG("completionRate")::float AS avg_rate_7d
+            FROM "DailyUserStats"
+            WHERE day >= %s
+            GROUP BY "userId"
+            """,
+            (start_day,),
+        )
+        return cur.fetchall()
+
+    today = utc_now()
+    today_start = datetime(today.year, today.month, today.day, tzinfo=timezone.utc)
+    cur.execute(
+        """
+        SELECT "userId",
+               SUM("createdCount")::int,
+               SUM("completedCount")::int,
+               SUM("completionRate")::float,
+               COUNT(*)::int
+        FROM "DailyUserStats"
+        WHERE day >= %s AND day < %s
+        GROUP BY "userId"
+        """,
+        (start_day, today_start),
+    )
+    acc = {user_id: [c or 0, d or 0, r or 0.0, n] for user_id, c, d, r, n in cur.fetchall()}
+    for user_id, (c, d) in today_stats.items():
+        a = acc.setdefault(user_id, [0, 0, 0.0, 0])
+        a[0] += c
+        a[1] += d
+        a[2] += (d / c) if c > 0 else 0.0
+        a[3] += 1
+    return [(user_id, c, d, (r / n) if n else 0.0) for user_id, (c, d, r, n) in acc.items()]
+
+def load_lag_sketches(cur, start_day: datetime, today_features: dict = None) -> dict:
+    """
+    userId -> completion-lag sketch merged over the window's DailyUserFeatures days.
+    today_features (userId -> feature dict) from daily_features replaces today's rows.
+    """
+    sql = """
+        SELECT "userId", "completionLagSketch"
+        FROM "DailyUserFeatures"
+        WHERE day >= %s AND "completionLagCount" > 0 {upper}
+    """
+    if today_features is None:
+        cur.execute(sql.format(upper=""), (start_day,))
+        rows = cur.fetchall()
+    else:
+        today = utc_now()
+        today_start = datetime(today.year, today.month, today.day, tzinfo=timezone.utc)
+        cur.execute(sql.format(upper="AND day < %s"), (start_day, today_start))
+        rows = cur.fetchall() + [
+            (user_id, f["completionLagSketch"])
+            for user_id, f in today_features.items()
+            if f["completionLagCount"] > 0
+        ]
+
+    by_user = {}
+    for user_id, sketch in rows:
+        by_user.setdefault(user_id, []).append(sketch)
+    return {user_id: merge_sketches(s) for user_id, s in by_user.items()}
+
+def load_today(cur):
+    """Today's DailyUserStats and DailyUserFeatures rows, in the shape daily_stats/daily_features return."""
+    today = utc_now()
+    today_start = datetime(today.year, today.month, today.day, tzinfo=timezone.utc)
+    cur.execute(
+        'SELECT "userId", "createdCount", "completedCount" FROM "DailyUserStats" WHERE day = %s',
+        (today_start,),
+    )
+    today_stats = {user_id: (int(c or 0), int(d or 0)) for user_id, c, d in cur.fetchall()}
+    cur.execute(
+        'SELECT "userId", "completionLagCount", "completionLagSketch" FROM "DailyUserFeatures" WHERE day = %s',
+        (today_start,),
+    )
+    today_features = {
+        user_id: {"completionLagCount": int(n or 0), "completionLagSketch": sketch}
+        for user_id, n, sketch in cur.fetchall()
+    }
+    return today_stats, today_features
+
+def load_inputs(conn, start_day: datetime, today_stats: dict = None, read_conn=None, today_features: dict = None):
+    """(7-day window rows, userId -> lag sketch); earlier days can come from read_conn (a replica)."""
+    if read_conn is not None and read_conn is not conn and (today_stats is None or today_features is None):
+        # today's rows were just written by the cron step and may not have replayed yet: read them on the primary
+        with conn.cursor() as cur:
+            stats, features = load_today(cur)
+        today_stats = stats if today_stats is None else today_stats
+        today_features = features if today_features is None else today_features
+
+    with (read_conn or conn).cursor() as rcur:
+        rows = load_window(rcur, start_day, today_stats)
+        lag_sketches = load_lag_sketches(rcur, start_day, today_features)
+    return rows, lag_sketches
+
+def generate(conn, today_stats: dict = None, read_conn=None, today_features: dict = None) -> int:
+    """
+    today_stats / today_features: today's per-user results from daily_stats / daily_features
+    (the pipeline hands them over in memory instead of re-reading today's rows).
+    """
     now = utc_now()
     start = now - timedelta(days=7)
+    start_day = datetime(start.year, start.month, start.day, tzinfo=timezone.utc)
 
-    with psycopg.connect(DATABASE_URL) as conn:
-        with conn.cursor() as cur:
-            # 7-day aggregates per user
-            cur.execute(
-                """
-                SELECT "userId",
-                       SUM("createdCount")::int AS created_7d,
-                       SUM("completedCount")::int AS completed_7d,
-                       AVG("completionRate")::float AS avg_rate_7d
-                FROM "DailyUserStats"
-                WHERE day >= %s
-                GROUP BY "userId"
-                """,
-                (datetime(start.year, start.month, start.day, tzinfo=timezone.utc),),
-            )
-
-            rows = cur.fetchall()
-
-            for user_id, created_7d, completed_7d, avg_rate_7d in rows:
-                created_7d = int(created_7d or 0)
-                completed_7d = int(completed_7d or 0)
-                avg_rate_7d = float(avg_rate_7d or 0.0)
-
-                # Rec 1: low completion rate
-                if created_7d >= 5 and avg_rate_7d < 0.4:
-                    score = min(1.0, (0.4 - avg_rate_7d) / 0.4 + 0.3)
-                    upsert_rec(
-                        cur,
-                        user_id,
-                        "LOW_COMPLETION_RATE",
-                        score,
-                        "נראה שאתה מוסיף יותר משימות ממה שאתה מסיים. נסה לצמצם את רשימת היום ל-3 משימות מרכזיות ולתת עדיפות אחת ברורה בבוקר.",
-                        {
-                            "windowDays": 7,
-                            "created": created_7d,
-                            "completed": completed_7d,
-                            "avgCompletionRate": avg_rate_7d
-                        },
-                        ttl_hours=24,
-                    )
+    # window read can go to a replica; upserts always go to conn (primary)
+    rows, lag_sketches = load_inputs(conn, start_day, today_stats, read_conn, today_features)
+
+    with conn.cursor() as cur:
+        for user_id, created_7d, completed_7d, avg_rate_7d in rows:
+            created_7d = int(created_7d or 0)
+            completed_7d = int(completed_7d or 0)
+            avg_rate_7d = float(avg_rate_7d or 0.0)
+
+            # Rec 1: low completion rate
+            if created_7d >= 5 and avg_rate_7d < 0.4:
+                score = min(1.0, (0.4 - avg_rate_7d) / 0.4 + 0.3)
+                upsert_rec(
+                    cur,
+                    user_id,
+                    "LOW_COMPLETION_RATE",
+                    score,
+                    "נראה שאתה מוסיף יותר משימות ממה שאתה מסיים. נסה לצמצם את רשימת היום ל-3 משימות מרכזיות ולתת עדיפות אחת ברורה בבוקר.",
+                    {
+                        "windowDays": 7,
+                        "created": created_7d,
+                        "completed": completed_7d,
+                        "avgCompletionRate": avg_rate_7d
+                    },
+                    ttl_hours=24,
+                )
 
-                # Rec 2: high WIP pressure
-                if created_7d >= 15 and completed_7d < created_7d * 0.5:
-                    score = min(1.0, (created_7d - completed_7d) / max(1, created_7d))
+            # Rec 2: high WIP pressure
+            if created_7d >= 15 and completed_7d < created_7d * 0.5:
+                score = min(1.0, (created_7d - completed_7d) / max(1, created_7d))
+                upsert_rec(
+                    cur,
+                    user_id,
+                    "HIGH_WIP",
+                    score,
+                    "העומס נראה גבוה השבוע. מומלץ להקפיא יצירת משימות חדשות ליום אחד ולהתמקד בסגירה של משימות פתוחות.",
+                    {
+                        "windowDays": 7,
+                        "created": created_7d,
+                        "completed": completed_7d,
+                        "openDelta": created_7d - completed_7d
+                    },
+                    ttl_hours=24,
+                )
+
+            # Rec 3: slow completion tail (p90 lag from the merged daily sketches)
+            sketch = lag_sketches.get(user_id)
+            lag_n = sum(sketch) if sketch else 0
+            if lag_n >= 5:
+                p50_h = quantile(sketch, 0.5)
+                p90_h = quantile(sketch, 0.9)
+                if p90_h >= 72:
+                    score = min(1.0, p90_h / 240.0 + 0.2)
                     upsert_rec(
                         cur,
                         user_id,
-                        "HIGH_WIP",
+                        "SLOW_COMPLETION",
                         score,
-                        "העומס נראה גבוה השבוע. מומלץ להקפיא יצירת משימות חדשות ליום אחד ולהתמקד בסגירה של משימות פתוחות.",
+                        "חלק מהמשימות שלך נשארות פתוחות כמה ימים לפני שהן נסגרות. נסה לפרק משימות גדולות לצעדים קטנים ולקבוע לכל אחת תאריך יעד.",
                         {
                             "windowDays": 7,
-                            "created": created_7d,
-                            "completed": completed_7d,
-                            "openDelta": created_7d - completed_7d
+                            "completedWithLag": lag_n,
+                            "completionLagP50H": round(p50_h, 1),
+                            "completionLagP90H": round(p90_h, 1)
                         },
                         ttl_hours=24,
                     )
 
-            conn.commit()
+        conn.commit()
 
     print(f"[recs] generated for users={len(rows)}")
+    return len(rows)
+
+def main():
+    with psycopg.connect(DATABASE_URL) as conn:
+        router = open_read_router(conn)
+        try:
+            generate(conn, read_conn=router.reader())
+        finally:
+            router.close()
 
 if __name__ == "__main__":
+    exit_if_check("recs")
     main()
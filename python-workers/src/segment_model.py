@@ -0,0 +1,45 @@
+"""
+Latest clustering model (SegmentModel) for placing a single user between cluster_users runs.
+
+cluster_users stores the scaler next to the centroids (featuresRef: features, mean, scale),
+so the realtime worker can pick the nearest centroid in the same standardized space KMeans
+used and write the segment id and label a cluster run would give the user. Plain Python:
+the realtime worker does not import numpy.
+"""
+
+
+def load_latest(cur):
+    """The most recently used model, or None if there is none (or it predates the stored scaler)."""
+    cur.execute('SELECT id, centroids, "featuresRef" FROM "SegmentModel" ORDER BY "lastUsedAt" DESC LIMIT 1')
+    row = cur.fetchone()
+    if not row:
+        return None
+    version, centroids, ref = row
+    ref = ref or {}
+    if not centroids or not all(key in ref for key in ("features", "mean", "scale")):
+        return None
+    return {
+        "id": version,
+        "centroids": centroids,
+        "features": ref["features"],
+        "mean": ref["mean"],
+        "scale": ref["scale"],
+    }
+
+
+def _standardize(model, values: dict) -> list:
+    return [
+        (float(values.get(f, 0.0)) - m) / (s or 1.0)
+        for f, m, s in zip(model["features"], model["mean"], model["scale"])
+    ]
+
+
+def nearest_segment(model, features: dict):
+    """(segment, label) of the model centroid closest to features (feature name -> raw value)."""
+    x = _standardize(model, features)
+
+    def dist(c):
+        return sum((a - b) ** 2 for a, b in zip(x, _standardize(model, c["centroid"])))
+
+    best = min(model["centroids"], key=dist)
+    return int(best["segment"]), best["label"]
@@ -0,0 +1,31 @@
+"""
+Fast-start helpers for the worker entry points.
+
+`python src/<worker>.py --check` imports the worker and its config (env vars are
+read at import), confirms lazily-loaded dependencies are installed without
+importing them, and exits 0 before connecting to Redis or Postgres. Heavy
+libraries (pandas, numpy, sklearn, SQLAlchemy) are imported inside the functions
+that use them, so neither --check nor a no-data run pays for them.
+
+See startup_bench.py for the per-worker import-time budget.
+"""
+import sys
+from importlib.util import find_spec
+
+
+def check_requested(argv=None) -> bool:
+    return "--check" in (sys.argv[1:] if argv is None else argv)
+
+
+def run_check(name: str, lazy_deps=()):
+    missing = [m for m in lazy_deps if find_spec(m) is None]
+    if missing:
+        print(f"[{name}] check failed: missing {', '.join(missing)}")
+        sys.exit(1)
+    print(f"[{name}] check ok")
+    sys.exit(0)
+
+
+def exit_if_check(name: str, lazy_deps=()):
+    if check_requested():
+        run_check(name, lazy_deps)
@@ -0,0 +1,107 @@
+"""
+Startup benchmark for the worker entry points.
+
+Runs each worker with `--check` under `python -X importtime` in a fresh
+interpreter, reports wall time, total import time and the heaviest top-level
+imports, and exits 1 if any worker's import time is over its budget (or if its
+check fails). Run it in CI or after adding a dependency:
+
+  python src/startup_bench.py
+  python src/startup_bench.py --repeat 5 --budget-ms 200
+  python src/startup_bench.py realtime_worker cluster_users
+
+No Redis or Postgres is needed; DATABASE_URL gets a placeholder if unset.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# import-time budget per entry point, ms (redis + psycopg + dotenv is the floor)
+BUDGET_MS = {
+    "worker": 400,
+    "realtime_worker": 400,
+    "daily_stats": 400,
+    "daily_features": 400,
+    "recommendations_v1": 400,
+    "cluster_users": 400,
+    "event_rollup": 400,
+    "pipeline": 500,
+}
+
+# should only be imported once there is work for them
+HEAVY = ("numpy", "pandas", "scipy", "sklearn", "sqlalchemy")
+
+
+def parse_importtime(stderr: str):
+    """(total import ms, [(top-level module, cumulative ms)], all module names) from -X importtime output."""
+    top, names = [], set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue  # header
+        name = parts[2]
+        names.add(name.strip())
+        if len(name) - len(name.lstrip()) == 1:
+            top.append((name.strip(), int(parts[1]) / 1000.0))
+    return sum(ms for _, ms in top), top, names
+
+
+def measure(worker: str, env: dict):
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", os.path.join(SRC_DIR, f"{worker}.py"), "--check"],
+        cwd=SRC_DIR, env=env, capture_output=True, text=True,
+    )
+    wall_ms = (time.perf_counter() - started) * 1000.0
+    import_ms, top, names = parse_importtime(proc.stderr)
+    return proc.returncode, wall_ms, import_ms, top, names, proc
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure worker cold-start import time against a budget")
+    parser.add_argument("workers", nargs="*", default=list(BUDGET_MS), help="entry points (default: all)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per worker; the fastest counts")
+    parser.add_argument("--budget-ms", type=float, help="override every worker's budget")
+    parser.add_argument("--top", type=int, default=5, help="heaviest top-level imports to list")
+    args = parser.parse_args()
+
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    env.setdefault("DATABASE_URL", "postgresql://check@localhost:5432/check")
+
+    failed = []
+    for worker in args.workers:
+        budget = args.budget_ms or BUDGET_MS.get(worker, 400)
+        runs = [measure(worker, env) for _ in range(max(1, args.repeat))]
+        code, wall_ms, import_ms, top, names, proc = min(runs, key=lambda r: r[2])
+
+        if code != 0:
+            print(f"[startup] {worker:<20} FAILED check (exit {code})")
+            errors = [l for l in proc.stderr.splitlines() if not l.startswith("import time:")]
+            print("\n".join([proc.stdout.strip(), *errors]).strip(), file=sys.stderr)
+            failed.append(worker)
+            continue
+
+        heavy = sorted({m.split(".")[0] for m in names} & set(HEAVY))
+        status = "ok" if import_ms <= budget else "OVER"
+        print(
+            f"[startup] {worker:<20} import={import_ms:7.1f}ms wall={wall_ms:7.1f}ms "
+            f"budget={budget:.0f}ms {status}" + (f" heavy={','.join(heavy)}" if heavy else "")
+        )
+        for name, ms in sorted(top, key=lambda t: -t[1])[: args.top]:
+            print(f"[startup]   {ms:7.1f}ms {name}")
+        if status != "ok":
+            failed.append(worker)
+
+    if failed:
+        print(f"[startup] over budget or failing: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,411 @@
+"""
+Capture and time-scaled replay of timeflow.events for capacity testing.
+
+  capture: export a time window of stream entries to a JSONL file, with userId,
+           taskId and eventId anonymised (keyed hash, stable within a capture so
+           hot users and per-user skew are preserved).
+  seed:    create the User, Task and TaskEvent rows a capture refers to in a
+           scratch Postgres. The anonymised ids exist nowhere else, and the
+           consumers' writes reference them by foreign key.
+  replay:  XADD a capture into a local Redis at a speed multiplier (1, 10, ... or
+           "max") while sampling consumer-group backlog and the age of the oldest
+           unacknowledged entry (stream ids carry their XADD time). Deliveries the
+           consumers never ack (the realtime worker does not re-read them) and
+           dead-lettered entries are counted as failures, not as latency.
+  report:  replay at increasing multipliers and report the highest one the
+           consumer fleet sustains.
+
+Usage:
+  python src/stream_replay.py capture --from 2026-01-14T00:00:00Z --to 2026-01-15T00:00:00Z -o cap.jsonl
+  python src/stream_replay.py seed cap.jsonl --database-url postgresql://localhost/timeflow_replay
+  python src/stream_replay.py replay cap.jsonl --speed 10
+  python src/stream_replay.py report cap.jsonl --speeds 1,2,5,10,max
+
+Run realtime_worker.py against the target Redis and the seeded scratch Postgres while replaying.
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import sys
+import threading
+import time
+import uuid
+
+import psycopg
+import redis
+from dotenv import load_dotenv
+
+from events import decode_entry, encode_v2_fields, parse_iso
+
+load_dotenv()
+
+SOURCE_REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+TARGET_REDIS_URL = os.environ.get("REPLAY_REDIS_URL", "redis://localhost:6379/0")
+SCRATCH_DATABASE_URL = os.environ.get("REPLAY_DATABASE_URL")
+
+STREAM = "timeflow.events"
+GROUP = "realtime-features"
+DLQ_STREAM = "timeflow.events.dlq"
+
+CAPTURE_PAGE = 1000
+REPLAY_PIPELINE = 500
+SEED_BATCH = 1000
+SAMPLE_EVERY_SEC = 1.0
+# a delivery still unacked after this long failed (consumers process an entry in well under a second)
+STUCK_AFTER_SEC = 10.0
+
+
+def _ms(dt_str: str) -> int:
+    return int(parse_iso(dt_str).timestamp() * 1000)
+
+
+def _id_ms(stream_id: str) -> int:
+    return int(stream_id.split("-", 1)[0])
+
+
+# --- capture -----------------------------------------------------------------
+
+class Anonymiser:
+    __slots__ = ("_key", "_cache")
+
+    def __init__(self, salt: str):
+        self._key = salt.encode()
+        self._cache = {}
+
+    def __call__(self, value):
+        if not value:
+            return value
+        out = self._cache.get(value)
+        if out is None:
+            out = "anon_" + hmac.new(self._key, value.encode(), hashlib.sha256).hexdigest()[:20]
+            self._cache[value] = out
+        return out
+
+
+def anonymise_entry(fields: dict, anon: Anonymiser):
+    """
+    The entry with user, task and event ids anonymised, in its original encoding; None for an
+    unknown version. The anonymised ids exist nowhere until `seed` creates them.
+    """
+    events = decode_entry(fields)
+    if events is None:
+        return None
+    for ev in events:
+        ev.user_id = anon(ev.user_id)
+        ev.task_id = anon(ev.task_id)
+        ev.event_id = anon(ev.event_id)
+    if fields.get("version") == "2":
+        return encode_v2_fields(events)
+    return events[0].to_v1_fields()
+
+
+def capture(args):
+    r = redis.Redis.from_url(args.source, decode_responses=True)
+    anon = Anonymiser(args.salt or secrets.token_hex(16))
+    start = f"{_ms(args.start)}-0"
+    end = f"{_ms(args.end) - 1}-18446744073709551615"
+
+    written = skipped = 0
+    with open(args.output, "w") as f:
+        while True:
+            page = r.xrange(args.stream, min=start, max=end, count=CAPTURE_PAGE)
+            for stream_id, fields in page:
+                out = anonymise_entry(fields, anon)
+                if out is None:
+                    skipped += 1
+                    continue
+                f.write(json.dumps({"id": stream_id, "fields": out}) + "\n")
+                written += 1
+            if len(page) < CAPTURE_PAGE:
+                break
+            start = "(" + page[-1][0]
+
+    print(f"[capture] wrote entries={written} skipped={skipped} to {args.output}")
+
+
+# --- seed --------------------------------------------------------------------
+
+def load_capture(path: str) -> list:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def seed_rows(entries: list):
+    """(users, tasks as (taskId, userId), task events as (id, userId, taskId, type, createdAt))."""
+    users, tasks, task_events = {}, {}, []
+    for e in entries:
+        for ev in decode_entry(e["fields"]) or ():
+            users.setdefault(ev.user_id, None)
+            if ev.task_id:
+                tasks.setdefault(ev.task_id, ev.user_id)
+            task_events.append((ev.event_id or str(uuid.uuid4()), ev.user_id, ev.task_id, ev.type, ev.created_at))
+    return list(users), list(tasks.items()), task_events
+
+
+def _executemany(conn, sql: str, rows: list):
+    with conn.cursor() as cur:
+        for i in range(0, len(rows), SEED_BATCH):
+            cur.executemany(sql, rows[i:i + SEED_BATCH])
+            conn.commit()
+
+
+def seed(args):
+    users, tasks, task_events = seed_rows(load_capture(args.capture))
+    with psycopg.connect(args.database_url) as conn:
+        _executemany(
+            conn,
+            """
+            INSERT INTO "User" (id, email, "passwordHash", "updatedAt")
+            VALUES (%s, %s || '@replay.invalid', '!', now())
+            ON CONFLICT DO NOTHING
+            """,
+            [(u, u) for u in users],
+        )
+        _executemany(
+            conn,
+            """
+            INSERT INTO "Task" (id, "userId", title, "updatedAt")
+            VALUES (%s, %s, 'replay', now())
+            ON CONFLICT (id) DO NOTHING
+            """,
+            tasks,
+        )
+        # the rollup and claim_completion's index-miss lookup read TaskEvent, as they would in production
+        _executemany(
+            conn,
+            """
+            INSERT INTO "TaskEvent" (id, "userId", "taskId", type, "createdAt")
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (id) DO NOTHING
+            """,
+            task_events,
+        )
+    print(f"[seed] users={len(users)} tasks={len(tasks)} taskEvents={len(task_events)}")
+
+
+# --- replay ------------------------------------------------------------------
+
+
+def backlog_sample(r: redis.Redis, stream: str, group: str, stuck_after: float = STUCK_AFTER_SEC):
+    """
+    (backlog entries, age in seconds of the oldest of them, failed deliveries); Nones without the group.
+    Pending entries unacked for longer than stuck_after are failed deliveries, not backlog.
+    """
+    info = next((g for g in r.xinfo_groups(stream) if g["name"] == group), None)
+    if info is None:
+        return None, None, None
+    pending = int(info.get("pending") or 0)
+    lag = int(info.get("lag") or 0)
+
+    failed = 0
+    oldest_ms = None
+    if pending:
+        for p in r.xpending_range(stream, group, min="-", max="+", count=pending):
+            if p["time_since_delivered"] >= stuck_after * 1000:
+                failed += 1
+            elif oldest_ms is None:
+                oldest_ms = _id_ms(p["message_id"])
+    if oldest_ms is None and lag:
+        nxt = r.xrange(stream, min="(" + info["last-delivered-id"], max="+", count=1)
+        if nxt:
+            oldest_ms = _id_ms(nxt[0][0])
+
+    age = (time.time() * 1000 - oldest_ms) / 1000.0 if oldest_ms else 0.0
+    return pending - failed + lag, age, failed
+
+
+class Monitor(threading.Thread):
+    def __init__(self, r, stream, group, stuck_after):
+        super().__init__(daemon=True)
+        self.r, self.stream, self.group, self.stuck_after = r, stream, group, stuck_after
+        self.samples = []
+        self._halt = threading.Event()
+
+    def run(self):
+        while not self._halt.is_set():
+            backlog, age, _ = backlog_sample(self.r, self.stream, self.group, self.stuck_after)
+            if backlog is not None:
+                self.samples.append((time.monotonic(), backlog, age))
+            self._halt.wait(SAMPLE_EVERY_SEC)
+
+    def stop(self):
+        self._halt.set()
+        self.join()
+
+
+def _pct(values, q):
+    if not values:
+        return 0.0
+    s = sorted(values)
+    return s[min(len(s) - 1, int(q * len(s)))]
+
+
+def send_offsets(entries: list, speed) -> list:
+    """Seconds after the start at which each entry is sent: captured spacing divided by speed (none for "max")."""
+    if speed == "max" or not entries:
+        return [0.0] * len(entries)
+    first_ms = _id_ms(entries[0]["id"])
+    return [(_id_ms(e["id"]) - first_ms) / 1000.0 / speed for e in entries]
+
+
+def replay(r: redis.Redis, entries: list, speed, stream: str, group: str, drain_timeout: float,
+           stuck_after: float = STUCK_AFTER_SEC, dlq_stream: str = DLQ_STREAM) -> dict:
+    groups = {g["name"] for g in r.xinfo_groups(stream)} if r.exists(stream) else set()
+    if group not in groups:
+        print(f"[replay] warning: group {group} not found on {stream}; start the consumers first")
+
+    # failures left over from earlier runs are not this run's
+    _, _, failed_before = backlog_sample(r, stream, group, stuck_after)
+    dlq_before = r.xlen(dlq_stream)
+
+    monitor = Monitor(r, stream, group, stuck_after)
+    monitor.start()
+
+    started = time.monotonic()
+    pipe = r.pipeline(transaction=False)
+    queued = 0
+    for e, offset in zip(entries, send_offsets(entries, speed)):
+        if offset > 0:
+            delay = started + offset - time.monotonic()
+            if delay > 0:
+                if queued:
+                    pipe.execute()
+                    queued = 0
+                time.sleep(delay)
+        pipe.xadd(stream, e["fields"])
+        queued += 1
+        if queued >= REPLAY_PIPELINE:
+            pipe.execute()
+            queued = 0
+    if queued:
+        pipe.execute()
+    send_s = time.monotonic() - started
+
+    drained_after = None
+    deadline = time.monotonic() + drain_timeout
+    while time.monotonic() < deadline:
+        backlog, _, _ = backlog_sample(r, stream, group, stuck_after)
+        if backlog == 0:
+            drained_after = time.monotonic() - started - send_s
+            break
+        time.sleep(0.2)
+    monitor.stop()
+    _, _, failed_after = backlog_sample(r, stream, group, stuck_after)
+
+    ages = [a for _, _, a in monitor.samples]
+    backlogs = [b for _, b, _ in monitor.samples]
+    return {
+        "speed": speed,
+        "entries": len(entries),
+        "sendSec": round(send_s, 2),
+        "rate": round(len(entries) / send_s, 1) if send_s > 0 else None,
+        "maxBacklog": max(backlogs, default=0),
+        "latencyP50Sec": round(_pct(ages, 0.5), 2),
+        "latencyP95Sec": round(_pct(ages, 0.95), 2),
+        "latencyMaxSec": round(max(ages, default=0.0), 2),
+        "drainedAfterSec": round(drained_after, 2) if drained_after is not None else None,
+        "failedDeliveries": (failed_after or 0) - (failed_before or 0),
+        "deadLettered": r.xlen(dlq_stream) - dlq_before,
+    }
+
+
+def _speed(value: str):
+    return "max" if value == "max" else float(value)
+
+
+def _print_result(res: dict):
+    print(
+        f"[replay] speed={res['speed']} entries={res['entries']} send={res['sendSec']}s rate={res['rate']}/s "
+        f"maxBacklog={res['maxBacklog']} latency p50={res['latencyP50Sec']}s p95={res['latencyP95Sec']}s "
+        f"max={res['latencyMaxSec']}s drained={res['drainedAfterSec']} "
+        f"failed={res['failedDeliveries']} deadLettered={res['deadLettered']}"
+    )
+
+
+def run_replay(args):
+    r = redis.Redis.from_url(args.target, decode_responses=True)
+    res = replay(
+        r, load_capture(args.capture), _speed(args.speed), args.stream, args.group, args.drain_timeout,
+        args.stuck_after, args.dlq_stream,
+    )
+    _print_result(res)
+    if args.json:
+        print(json.dumps(res))
+
+
+def run_report(args):
+    r = redis.Redis.from_url(args.target, decode_responses=True)
+    entries = load_capture(args.capture)
+    sustained = None
+    failures = 0
+    for speed in [_speed(s) for s in args.speeds.split(",")]:
+        res = replay(
+            r, entries, speed, args.stream, args.group, args.drain_timeout, args.stuck_after, args.dlq_stream,
+        )
+        _print_result(res)
+        failures += res["failedDeliveries"] + res["deadLettered"]
+        if entries and res["failedDeliveries"] + res["deadLettered"] >= len(entries):
+            print("[report] every delivery failed; seed the scratch database first (stream_replay.py seed)")
+            sys.exit(1)
+        ok = res["drainedAfterSec"] is not None and res["latencyP95Sec"] <= args.max_latency
+        if not ok:
+            print(f"[report] {speed}x not sustained (p95 latency > {args.max_latency}s or backlog did not drain)")
+            break
+        sustained = speed
+
+    if failures:
+        print(f"[report] {failures} deliveries failed or were dead-lettered; see the consumer logs")
+    if sustained is None:
+        print("[report] consumers did not sustain any tested speed")
+        sys.exit(1)
+    print(f"[report] sustained up to {sustained}x of captured traffic")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Capture and replay timeflow.events for capacity testing")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("capture", help="export a time window of stream entries (anonymised)")
+    p.add_argument("--from", dest="start", required=True, help="ISO 8601 start (inclusive)")
+    p.add_argument("--to", dest="end", required=True, help="ISO 8601 end (exclusive)")
+    p.add_argument("-o", "--output", required=True)
+    p.add_argument("--source", default=SOURCE_REDIS_URL)
+    p.add_argument("--stream", default=STREAM)
+    p.add_argument("--salt", help="anonymisation key (random per capture by default)")
+    p.set_defaults(func=capture)
+
+    p = sub.add_parser("seed", help="create the capture's users, tasks and task events in a scratch Postgres")
+    p.add_argument("capture")
+    p.add_argument("--database-url", default=SCRATCH_DATABASE_URL,
+                   help="scratch Postgres the consumers use (default: REPLAY_DATABASE_URL)")
+    p.set_defaults(func=seed)
+
+    for name, func in (("replay", run_replay), ("report", run_report)):
+        p = sub.add_parser(name)
+        p.add_argument("capture")
+        p.add_argument("--target", default=TARGET_REDIS_URL, help="Redis to replay into (local!)")
+        p.add_argument("--stream", default=STREAM)
+        p.add_argument("--group", default=GROUP, help="consumer group to measure")
+        p.add_argument("--drain-timeout", type=float, default=30.0)
+        p.add_argument("--stuck-after", type=float, default=STUCK_AFTER_SEC,
+                       help="seconds after which an unacked delivery counts as failed")
+        p.add_argument("--dlq-stream", default=DLQ_STREAM)
+        p.set_defaults(func=func)
+        if name == "replay":
+            p.add_argument("--speed", default="1", help="multiplier, e.g. 1, 10 or max")
+            p.add_argument("--json", action="store_true", help="also print the result as JSON")
+        else:
+            p.add_argument("--speeds", default="1,2,5,10,20,50,max")
+            p.add_argument("--max-latency", type=float, default=5.0, help="p95 oldest-unacked age limit (s)")
+
+    args = parser.parse_args()
+    if args.cmd == "seed" and not args.database_url:
+        parser.error("seed needs --database-url or REPLAY_DATABASE_URL (a scratch database)")
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Task timing index: taskId -> createdAt, kept in the narrow "TaskTiming" table.
+
+TASK_CREATED events insert the row; the first TASK_COMPLETED claims completedAt
+and its lag is folded into the running "completionLagSumH"/"completionLagCount"
+and "completionLagSketch" of the completion day in DailyUserFeatures. Tasks that
+span days are covered because the lookup is by taskId, not by the completion day's
+events.
+"""
+import uuid
+from datetime import datetime, timezone
+
+from lag_sketch import bucket_index, empty
+
+
+def index_task_created(cur, task_id: str, user_id: str, created_at: datetime):
+    cur.execute(
+        """
+        INSERT INTO "TaskTiming" ("taskId", "userId", "createdAt")
+        VALUES (%s, %s, %s)
+        ON CONFLICT ("taskId") DO NOTHING
+        """,
+        (task_id, user_id, created_at),
+    )
+
+
+def _as_utc(dt: datetime) -> datetime:
+    # TIMESTAMP(3) columns (no tz) come back naive; Prisma stores them in UTC
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt
+
+
+def claim_completion(cur, task_id: str, completed_at: datetime):
+    """Returns the task's createdAt (tz-aware, UTC) the first time it is completed, else None."""
+    sql = """
+        UPDATE "TaskTiming"
+        SET "completedAt" = %s
+        WHERE "taskId" = %s AND "completedAt" IS NULL
+        RETURNING "createdAt"
+    """
+    cur.execute(sql, (completed_at, task_id))
+    row = cur.fetchone()
+    if row:
+        return _as_utc(row[0])
+
+    # index miss (e.g. created before the worker saw it): fill from TaskEvent once
+    cur.execute(
+        """
+        INSERT INTO "TaskTiming" ("taskId", "userId", "createdAt")
+        SELECT "taskId", "userId", MIN("createdAt")
+        FROM "TaskEvent"
+        WHERE "taskId" = %s AND type = 'TASK_CREATED'
+        GROUP BY "taskId", "userId"
+        ON CONFLICT ("taskId") DO NOTHING
+        """,
+        (task_id,),
+    )
+    if cur.rowcount == 0:
+        return None
+
+    cur.execute(sql, (completed_at, task_id))
+    row = cur.fetchone()
+    return _as_utc(row[0]) if row else None
+
+
+def lag_hours(created_at: datetime, completed_at: datetime) -> float:
+    return (completed_at - created_at).total_seconds() / 3600.0
+
+
+def fold_completion_lag(cur, user_id: str, day_start: datetime, lag_h: float):
+    idx = bucket_index(lag_h)
+    sketch = empty()
+    sketch[idx] = 1
+    cur.execute(
+        """
+        INSERT INTO "DailyUserFeatures" (
+          "id", "userId", day,
+          "completionLagSumH", "completionLagCount", "avgCompletionLagH", "completionLagSketch",
+          "updatedAt"
+        )
+        VALUES (%(id)s, %(user_id)s, %(day)s, %(lag)s, 1, %(lag)s, %(sketch)s, now())
+        ON CONFLICT ("userId", day)
+        DO UPDATE SET
+          "completionLagSumH" = "DailyUserFeatures"."completionLagSumH" + EXCLUDED."completionLagSumH",
+          "completionLagCount" = "DailyUserFeatures"."completionLagCount" + 1,
+          "avgCompletionLagH" = ("DailyUserFeatures"."completionLagSumH" + EXCLUDED."completionLagSumH")
+                                / ("DailyUserFeatures"."completionLagCount" + 1),
+          "completionLagSketch"[%(pos)s] = COALESCE("DailyUserFeatures"."completionLagSketch"[%(pos)s], 0) + 1,
+          "updatedAt" = now()
+        """,
+        {
+            "id": str(uuid.uuid4()), "user_id": user_id, "day": day_start,
+            "lag": lag_h, "sketch": sketch, "pos": idx + 1,  # pg arrays are 1-based
+        },
+    )
+
+
+def backfill_for_window(cur, start: datetime, end: datetime) -> dict:
+    """
+    Batch safety net for events the realtime worker has not seen (yet).
+
+    Returns userId -> (lag sum in hours, count, sketch) for the completions in [start, end) this
+    call claimed. Completions already claimed by the realtime worker are folded there, so the
+    caller adds this delta to the day's totals instead of overwriting them.
+    """
+    cur.execute(
+        """
+        INSERT INTO "TaskTiming" ("taskId", "userId", "createdAt")
+        SELECT "taskId", "userId", MIN("createdAt")
+        FROM "TaskEvent"
+        WHERE type = 'TASK_CREATED' AND "taskId" IS NOT NULL
+          AND "createdAt" >= %s AND "createdAt" < %s
+        GROUP BY "taskId", "userId"
+        ON CONFLICT ("taskId") DO NOTHING
+        """,
+        (start, end),
+    )
+    cur.execute(
+        """
+        UPDATE "TaskTiming" t
+        SET "completedAt" = c.d_at
+        FROM (
+          SELECT "taskId", MIN("createdAt") AS d_at
+          FROM "TaskEvent"
+          WHERE type = 'TASK_COMPLETED' AND "taskId" IS NOT NULL
+            AND "createdAt" >= %s AND "createdAt" < %s
+          GROUP BY "taskId"
+        ) c
+        WHERE t."taskId" = c."taskId" AND t."completedAt" IS NULL
+        RETURNING t."userId", EXTRACT(EPOCH FROM (t."completedAt" - t."createdAt"))::float / 3600.0
+        """,
+        (start, end),
+    )
+    out = {}
+    for user_id, lag_h in cur.fetchall():
+        lag_sum, lag_count, sketch = out.get(user_id, (0.0, 0, None))
+        sketch = sketch or empty()
+        sketch[bucket_index(lag_h)] += 1
+        out[user_id] = (lag_sum + lag_h, lag_count + 1, sketch)
+    return out
@@ -2,7 +2,7 @@
 Event processor worker: consumes from Redis Streams and marks TaskEvent as processed.
 
 Consumes from timeflow.events (consumer group: event-processor).
-See docs/EVENTS_CONTRACT.md for the event format and conventions.
+See docs/EVENTS_CONTRACT.md for the event format (v1 and v2 entries) and conventions.
 """
 
 import os
@@ -13,6 +13,9 @@ import redis
 import psycopg
 from dotenv import load_dotenv
 
+from events import decode_entry, dlq_entries
+from startup import exit_if_check
+
 load_dotenv()
 
 REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
@@ -80,16 +83,27 @@ def main():
 
             for stream_name, messages in resp:
                 for msg_id, kv in messages:
-                    event_id = kv.get("eventId")
-                    event_type = kv.get("type", "UNKNOWN")
+                    try:
+                        events = decode_entry(kv)
+                    except (KeyError, ValueError) as e:
+                        # retrying cannot fix the encoding: dead-letter it right away
+                        for dlq_fields in dlq_entries(msg_id, kv, None, f"malformed entry: {e}"):
+                            r.xadd(DLQ_STREAM, dlq_fields)
+                        r.xack(STREAM, GROUP, msg_id)
+                        print("[worker] malformed message moved to DLQ", msg_id, str(e))
+                        continue
 
-                    if not event_id:
-                        print("[worker] skipping message without eventId:", msg_id)
+                    if events is None:
+                        print("[worker] skipping unknown version", msg_id, kv.get("version"))
                         r.xack(STREAM, GROUP, msg_id)
                         continue
 
                     try:
-                        process_event(conn, event_id, event_type)
+                        for ev in events:
+                            if not ev.event_id:
+                                print("[worker] skipping event without eventId:", msg_id)
+                                continue
+                            process_event(conn, ev.event_id, ev.type)
                         r.xack(STREAM, GROUP, msg_id)
                     except Exception as e:
                         conn.rollback()
@@ -98,7 +112,8 @@ def main():
                         r.expire(attempts_key, ATTEMPTS_TTL_SEC)
 
                         if attempts >= MAX_RETRIES:
-                            r.xadd(DLQ_STREAM, {"msgId": msg_id, **kv, "error": str(e)})
+                            for dlq_fields in dlq_entries(msg_id, kv, events, str(e)):
+                                r.xadd(DLQ_STREAM, dlq_fields)
                             r.xack(STREAM, GROUP, msg_id)
                             print("[worker] moved to DLQ", msg_id, str(e))
                         else:
@@ -106,4 +121,5 @@ def main():
 
 
 if __name__ == "__main__":
+    exit_if_check("worker")
     main()
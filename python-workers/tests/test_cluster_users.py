@@ -0,0 +1,42 @@
+import uuid
+from datetime import timedelta
+
+import cluster_users
+import pipeline
+
+
+def test_standalone_and_pipeline_resolve_the_same_driver():
+    # conftest sets DATABASE_URL to a plain postgresql:// URL
+    assert cluster_users.SQLALCHEMY_DATABASE_URL.startswith("postgresql+psycopg://")
+    assert cluster_users.SQLALCHEMY_DATABASE_URL == pipeline.SQLALCHEMY_DATABASE_URL
+
+
+def test_window_reads_today_on_the_primary(conn, user_id):
+    from sqlalchemy import create_engine, text
+
+    today = cluster_users.utc_now().replace(hour=0, minute=0, second=0, microsecond=0)
+    with conn.cursor() as cur:
+        cur.executemany(
+            """
+            INSERT INTO "DailyUserFeatures" (id, "userId", day, "createdCount", "updatedAt")
+            VALUES (%s, %s, %s, %s, now())
+            """,
+            [(str(uuid.uuid4()), user_id, today - timedelta(days=1), 3), (str(uuid.uuid4()), user_id, today, 5)],
+        )
+    conn.commit()
+
+    replica = create_engine(cluster_users.SQLALCHEMY_DATABASE_URL)
+    try:
+        with replica.connect() as primary:
+            # written on the primary, not yet visible on the replica
+            primary.execute(
+                text('UPDATE "DailyUserFeatures" SET "createdCount" = 7 WHERE "userId" = :u AND day = :d'),
+                {"u": user_id, "d": today},
+            )
+            df = cluster_users.load_window(replica, today - timedelta(days=30), primary=primary)
+            primary.rollback()
+    finally:
+        replica.dispose()
+
+    mine = df[df["userId"] == user_id].sort_values("day")
+    assert list(mine["createdCount"]) == [3, 7]
@@ -0,0 +1,71 @@
+import os
+import uuid
+from datetime import timedelta
+
+import psycopg
+
+import daily_features
+from events import Event, day_start_for
+from lag_sketch import bucket_index
+from realtime_worker import handle_events
+from test_realtime_worker import _lag_row, _now
+
+
+def _task(cur, user_id, task_id):
+    cur.execute(
+        'INSERT INTO "Task" (id, "userId", title, "updatedAt") VALUES (%s, %s, %s, now())',
+        (task_id, user_id, task_id),
+    )
+
+
+def _task_event(cur, user_id, task_id, event_type, at):
+    cur.execute(
+        'INSERT INTO "TaskEvent" (id, "userId", "taskId", type, "createdAt") VALUES (%s, %s, %s, %s, %s)',
+        (str(uuid.uuid4()), user_id, task_id, event_type, at),
+    )
+
+
+def test_batch_adds_its_claims_to_realtime_folds(conn, user_id, monkeypatch):
+    completed_at = _now()
+    day = day_start_for(completed_at)
+    t1, t2, t3 = (f"{user_id}-{n}" for n in ("rt", "batch", "late"))
+
+    with conn.cursor() as cur:
+        for t in (t1, t2, t3):
+            _task(cur, user_id, t)
+        # t2 only reached TaskEvent (the realtime worker has not seen it)
+        _task_event(cur, user_id, t2, "TASK_CREATED", completed_at - timedelta(hours=2))
+        _task_event(cur, user_id, t2, "TASK_COMPLETED", completed_at)
+        for t in (t1, t3):
+            cur.execute(
+                'INSERT INTO "TaskTiming" ("taskId", "userId", "createdAt") VALUES (%s, %s, %s)',
+                (t, user_id, (completed_at - timedelta(hours=1)).replace(tzinfo=None)),
+            )
+    conn.commit()
+
+    def realtime_completion(task_id):
+        ev = Event(f"ev-{task_id}", "TASK_COMPLETED", user_id, task_id, completed_at, day)
+        with psycopg.connect(os.environ["DATABASE_URL"]) as other:
+            handle_events(other, [ev])
+
+    realtime_completion(t1)
+
+    # the realtime worker commits t3's fold while the batch is between its claim and its upsert
+    created_by_hour = daily_features.created_by_hour
+
+    def fold_meanwhile(cur, start, end):
+        realtime_completion(t3)
+        return created_by_hour(cur, start, end)
+
+    monkeypatch.setattr(daily_features, "created_by_hour", fold_meanwhile)
+
+    features = daily_features.compute_for_day(conn, day.date(), counts={user_id: (3, 3)})
+
+    lag_sum, lag_count, avg_lag, sketch = _lag_row(conn, user_id, day)
+    assert lag_count == 3
+    assert abs(lag_sum - 4.0) < 1e-6
+    assert abs(avg_lag - 4.0 / 3) < 1e-6
+    assert sketch[bucket_index(1.0)] == 2 and sketch[bucket_index(2.0)] == 1
+    # the returned features are the day's totals, for cluster_users/recommendations
+    assert features[user_id]["completionLagCount"] == 3
+    assert list(features[user_id]["completionLagSketch"]) == list(sketch)
@@ -0,0 +1,83 @@
+import psycopg
+import pytest
+
+import db
+from db import ReadRouter
+
+
+class StubConn:
+    """Answers the replica lag query with a fixed lag, or raises."""
+
+    def __init__(self, lag=0.0, error=None, broken=False):
+        self.lag, self.error, self.broken = lag, error, broken
+        self.checks = 0
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.checks += 1
+        if self.error:
+            raise self.error
+
+    def fetchone(self):
+        return (self.lag,)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(db.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_without_replica_reads_primary():
+    primary = StubConn()
+    assert ReadRouter(primary).reader() is primary
+
+
+def test_fresh_replica(clock):
+    primary, replica = StubConn(), StubConn(lag=1.0)
+    router = ReadRouter(primary, replica, max_lag_sec=5)
+    assert router.reader() is replica
+
+
+def test_lagging_replica_falls_back_until_it_catches_up(clock):
+    primary, replica = StubConn(), StubConn(lag=30.0)
+    router = ReadRouter(primary, replica, max_lag_sec=5)
+    assert router.reader() is primary
+
+    # the lag is re-checked at most every LAG_CHECK_EVERY_SEC
+    replica.lag = 0.0
+    assert router.reader() is primary
+    assert replica.checks == 1
+
+    clock[0] += db.LAG_CHECK_EVERY_SEC
+    assert router.reader() is replica
+    assert replica.checks == 2
+
+    replica.lag = 6.0
+    clock[0] += db.LAG_CHECK_EVERY_SEC
+    assert router.reader() is primary
+
+
+def test_lag_check_error_falls_back(clock):
+    primary = StubConn()
+    replica = StubConn(error=psycopg.OperationalError("replica went away"))
+    assert ReadRouter(primary, replica).reader() is primary
+
+
+def test_broken_replica_is_not_queried(clock):
+    primary, replica = StubConn(), StubConn(lag=0.0)
+    router = ReadRouter(primary, replica)
+    assert router.reader() is replica
+
+    replica.broken = True
+    assert router.reader() is primary
+    assert replica.checks == 1
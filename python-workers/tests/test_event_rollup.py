@@ -0,0 +1,98 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from event_rollup import COMPACT_OVERLAP, WATERMARK_NAME, compact, day_counts, hour_start
+from events import Event, day_start_for
+from realtime_worker import handle_events
+
+DAY = datetime(2026, 1, 14, tzinfo=timezone.utc)
+IST = timezone(timedelta(hours=5, minutes=30))
+
+
+def _task_event(cur, user_id, event_type, at):
+    cur.execute(
+        'INSERT INTO "TaskEvent" (id, "userId", type, "createdAt") VALUES (%s, %s, %s, %s)',
+        (str(uuid.uuid4()), user_id, event_type, at.astimezone(timezone.utc).replace(tzinfo=None)),
+    )
+
+
+def _set_watermark(cur, at):
+    cur.execute(
+        """
+        INSERT INTO "RollupWatermark" (name, watermark, "updatedAt") VALUES (%s, %s, now())
+        ON CONFLICT (name) DO UPDATE SET watermark = EXCLUDED.watermark
+        """,
+        (WATERMARK_NAME, at.replace(tzinfo=None)),
+    )
+
+
+def _raw_counts(cur, user_id, start, end):
+    cur.execute(
+        """
+        SELECT COUNT(*) FILTER (WHERE type = 'TASK_CREATED')::int, COUNT(*) FILTER (WHERE type = 'TASK_COMPLETED')::int
+        FROM "TaskEvent"
+        WHERE "userId" = %s AND "createdAt" >= %s AND "createdAt" < %s
+        """,
+        (user_id, start, end),
+    )
+    return cur.fetchone()
+
+
+def _hourly(cur, user_id):
+    cur.execute(
+        'SELECT hour, type, count FROM "TaskEventHourly" WHERE "userId" = %s ORDER BY hour, type',
+        (user_id,),
+    )
+    return cur.fetchall()
+
+
+def test_hour_start_is_the_utc_hour():
+    assert hour_start(datetime(2026, 1, 14, 16, 20, tzinfo=IST)) == datetime(2026, 1, 14, 10, tzinfo=timezone.utc)
+    assert hour_start(datetime(2026, 1, 14, 10, 59, 59)) == datetime(2026, 1, 14, 10, tzinfo=timezone.utc)
+
+
+def test_compact_matches_raw_counts(conn, user_id):
+    # everything runs in one transaction that is rolled back: the watermark is global
+    with conn.cursor() as cur:
+        _set_watermark(cur, DAY + timedelta(hours=10))
+        for at, event_type in [
+            (DAY + timedelta(hours=9, minutes=30), "TASK_CREATED"),  # late row inside the overlap
+            (DAY + timedelta(hours=10, minutes=5), "TASK_CREATED"),
+            (DAY + timedelta(hours=10, minutes=50), "TASK_COMPLETED"),
+            (DAY + timedelta(hours=11, minutes=59), "TASK_CREATED"),
+        ]:
+            _task_event(cur, user_id, event_type, at)
+
+        compact(cur, now=DAY + timedelta(hours=12, minutes=30))
+
+        assert [(h.hour, t, c) for h, t, c in _hourly(cur, user_id)] == [
+            (9, "TASK_CREATED", 1), (10, "TASK_COMPLETED", 1), (10, "TASK_CREATED", 1), (11, "TASK_CREATED", 1),
+        ]
+        [(_, created, completed)] = day_counts(cur, DAY, DAY + timedelta(days=1))
+        assert (created, completed) == _raw_counts(cur, user_id, DAY, DAY + timedelta(days=1)) == (3, 1)
+
+        cur.execute('SELECT watermark FROM "RollupWatermark" WHERE name = %s', (WATERMARK_NAME,))
+        assert cur.fetchone()[0] == datetime(2026, 1, 14, 12)
+
+        # a rerun replaces counts (no double counting) and picks up late rows within the overlap
+        _task_event(cur, user_id, "TASK_COMPLETED", DAY + timedelta(hours=11, minutes=10))
+        compact(cur, now=DAY + timedelta(hours=12, minutes=45))
+        [(_, created, completed)] = day_counts(cur, DAY, DAY + timedelta(days=1))
+        assert (created, completed) == _raw_counts(cur, user_id, DAY, DAY + timedelta(days=1)) == (3, 2)
+
+        # rows older than watermark - overlap are left to earlier runs
+        _task_event(cur, user_id, "TASK_CREATED", DAY + timedelta(hours=12) - COMPACT_OVERLAP - timedelta(minutes=1))
+        compact(cur, now=DAY + timedelta(hours=12, minutes=50))
+        assert day_counts(cur, DAY, DAY + timedelta(days=1))[0][1] == 3
+
+
+def test_realtime_refresh_with_an_offset_timestamp(conn, user_id):
+    # a v1 createdAt with a +05:30 offset must refresh the whole UTC hour, not a 30-minute-shifted window
+    with conn.cursor() as cur:
+        _task_event(cur, user_id, "TASK_CREATED", DAY + timedelta(hours=10, minutes=5))
+        _task_event(cur, user_id, "TASK_CREATED", DAY + timedelta(hours=10, minutes=50))
+    at = datetime(2026, 1, 14, 16, 20, tzinfo=IST)  # 10:50 UTC
+    handle_events(conn, [Event("ev-ist", "TASK_CREATED", user_id, None, at, day_start_for(at))])
+
+    with conn.cursor() as cur:
+        assert [(h.hour, t, c) for h, t, c in _hourly(cur, user_id)] == [(10, "TASK_CREATED", 2)]
@@ -0,0 +1,105 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from events import decode_entry, dlq_entries, encode_v2_fields
+
+# Same fixture as server/test/unit/events.encoding.test.ts (the Node publisher's output).
+V2_EVENTS = (
+    "ev1\tTASK_CREATED\tu1\tt1\t1768400457153\n"
+    "ev2\tTASK_COMPLETED\tu1\tt1\t1768435199999\n"
+    "ev3\tTASK_DELETED\tu2\t\t1768435200000"
+)
+V2_FIELDS = {"version": "2", "count": "3", "events": V2_EVENTS}
+
+
+def _utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def test_decode_v1():
+    (ev,) = decode_entry({
+        "version": "1", "eventId": "ev1", "type": "TASK_CREATED", "userId": "u1",
+        "taskId": "t1", "createdAt": "2026-01-14T14:20:57.153Z",
+    })
+    assert (ev.event_id, ev.type, ev.user_id, ev.task_id) == ("ev1", "TASK_CREATED", "u1", "t1")
+    assert ev.created_at == _utc(2026, 1, 14, 14, 20, 57, 153000)
+    assert ev.day_start == _utc(2026, 1, 14)
+
+
+def test_decode_v1_without_version_or_task():
+    (ev,) = decode_entry({"type": "TASK_DELETED", "userId": "u2", "createdAt": "2026-01-15T00:00:00.000Z"})
+    assert ev.task_id is None
+    assert ev.day_start == _utc(2026, 1, 15)
+
+
+def test_decode_v2_from_node_publisher():
+    evs = decode_entry(V2_FIELDS)
+    assert [(e.event_id, e.type, e.user_id, e.task_id) for e in evs] == [
+        ("ev1", "TASK_CREATED", "u1", "t1"),
+        ("ev2", "TASK_COMPLETED", "u1", "t1"),
+        ("ev3", "TASK_DELETED", "u2", None),
+    ]
+    assert evs[0].created_at == _utc(2026, 1, 14, 14, 20, 57, 153000)
+    # day boundaries
+    assert evs[1].day_start == _utc(2026, 1, 14)
+    assert evs[2].day_start == _utc(2026, 1, 15)
+
+
+def test_v2_round_trip():
+    evs = decode_entry(V2_FIELDS)
+    assert encode_v2_fields(evs) == V2_FIELDS
+
+
+def test_v1_round_trip_through_v2():
+    fields = {
+        "version": "1", "eventId": "ev1", "type": "TASK_CREATED", "userId": "u1",
+        "createdAt": "2026-01-14T14:20:57.153Z", "taskId": "t1",
+    }
+    (ev,) = decode_entry(encode_v2_fields(decode_entry(fields)))
+    assert ev.to_v1_fields() == fields
+
+
+def test_mixed_stream():
+    entries = [
+        {"version": "1", "eventId": "a", "type": "TASK_CREATED", "userId": "u1",
+         "taskId": "t9", "createdAt": "2026-01-14T10:00:00.000Z"},
+        V2_FIELDS,
+        {"version": "3", "payload": "?"},
+    ]
+    decoded = [decode_entry(f) for f in entries]
+    assert [len(d) if d is not None else None for d in decoded] == [1, 3, None]
+
+
+@pytest.mark.parametrize("fields", [
+    {"version": "2", "count": "1", "events": "ev1\tTASK_CREATED\tu1"},
+    {"version": "2", "count": "1", "events": "ev1\tTASK_CREATED\tu1\tt1\tnot-a-number"},
+    {"version": "1", "type": "TASK_CREATED"},
+    {"version": "2", "events": V2_EVENTS},  # no count
+    {"version": "2", "count": "3", "events": V2_EVENTS.rsplit("\n", 1)[0]},  # truncated
+    {"version": "2", "count": "2", "events": V2_EVENTS},
+])
+def test_malformed_entries_raise(fields):
+    # the workers dead-letter these right away and ack them
+    with pytest.raises((KeyError, ValueError)):
+        decode_entry(fields)
+
+
+def test_dlq_keeps_raw_fields_of_malformed_v2_entry():
+    fields = {"version": "2", "count": "3", "events": V2_EVENTS.rsplit("\n", 1)[0]}
+    assert dlq_entries("1-0", fields, None, "malformed entry") == [
+        {"msgId": "1-0", **fields, "error": "malformed entry"}
+    ]
+
+
+def test_dlq_splits_v2_into_v1_entries():
+    evs = decode_entry(V2_FIELDS)
+    out = dlq_entries("1-0", V2_FIELDS, evs, "boom")
+    assert len(out) == 3
+    assert all(e["msgId"] == "1-0" and e["version"] == "1" and e["error"] == "boom" for e in out)
+    assert "taskId" not in out[2]
+
+
+def test_dlq_keeps_v1_entry():
+    fields = {"version": "1", "type": "X", "userId": "u", "createdAt": "2026-01-14T10:00:00.000Z"}
+    assert dlq_entries("1-0", fields, None, "boom") == [{"msgId": "1-0", **fields, "error": "boom"}]
@@ -0,0 +1,48 @@
+import json
+
+import fakeredis
+import pytest
+
+import insights_snapshot
+from insights_snapshot import snapshot_generation_key, snapshot_key, write_snapshots
+
+
+@pytest.fixture
+def r():
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+def _invalidate(r, user_id):
+    # what the API's invalidateInsightsSnapshot does after a task mutation
+    r.incr(snapshot_generation_key(user_id))
+    r.delete(snapshot_key(user_id))
+
+
+def test_writes_snapshot_with_ttl(r, conn, user_id):
+    assert write_snapshots(r, conn, [user_id]) == 1
+
+    snap = json.loads(r.get(snapshot_key(user_id)))
+    assert snap["version"] == 1 and snap["userId"] == user_id
+    assert snap["taskSummary"]["total"] == 0
+    assert 0 < r.ttl(snapshot_key(user_id)) <= insights_snapshot.SNAPSHOT_TTL_SEC
+
+
+def test_invalidation_during_build_drops_the_write(r, conn, user_id, monkeypatch):
+    _invalidate(r, user_id)  # user already has a generation
+    build = insights_snapshot.build_snapshot
+
+    def build_then_mutate(cur, uid):
+        snap = build(cur, uid)
+        _invalidate(r, uid)  # API commits a task change while the worker holds the old rows
+        return snap
+
+    monkeypatch.setattr(insights_snapshot, "build_snapshot", build_then_mutate)
+
+    assert write_snapshots(r, conn, [user_id]) == 0
+    assert r.get(snapshot_key(user_id)) is None
+
+
+def test_writes_after_invalidation_settles(r, conn, user_id):
+    _invalidate(r, user_id)
+    assert write_snapshots(r, conn, [user_id]) == 1
+    assert r.get(snapshot_key(user_id)) is not None
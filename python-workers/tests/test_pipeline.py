@@ -0,0 +1,104 @@
+import threading
+import time
+
+import pytest
+
+import pipeline
+from pipeline import STAGES, run_pipeline
+
+
+def _stub_stages(monkeypatch, fail=(), sleep=0.0):
+    """Replaces every runner with a stub that records its start/end and returns "<name>-result"."""
+    log = []
+    seen = {}
+    lock = threading.Lock()
+
+    def make(name):
+        def run(engine, reader, day, results):
+            with lock:
+                log.append(("start", name))
+                seen[name] = dict(results)
+            time.sleep(sleep)
+            with lock:
+                log.append(("end", name))
+            if name in fail:
+                raise RuntimeError(f"{name} broke")
+            return f"{name}-result"
+        return run
+
+    monkeypatch.setattr(pipeline, "STAGES", {name: (deps, make(name)) for name, (deps, _) in STAGES.items()})
+    return log, seen
+
+
+def _position(log, event, name):
+    return log.index((event, name))
+
+
+def test_stages_run_after_their_dependencies(monkeypatch):
+    log, _ = _stub_stages(monkeypatch)
+
+    report = run_pipeline(engine=None, max_workers=2)
+
+    assert {name: status for name, (status, _) in report.items()} == {name: "ok" for name in STAGES}
+    for name, (deps, _) in STAGES.items():
+        for dep in deps:
+            assert _position(log, "end", dep) < _position(log, "start", name), (dep, name)
+
+
+def test_recommendations_waits_for_daily_features(monkeypatch):
+    # it reads today's completion-lag sketches from daily_features' results
+    assert "daily_features" in STAGES["recommendations"][0]
+    log, seen = _stub_stages(monkeypatch)
+
+    run_pipeline(engine=None, max_workers=2)
+
+    assert _position(log, "end", "daily_features") < _position(log, "start", "recommendations")
+    assert seen["recommendations"]["daily_features"] == "daily_features-result"
+    assert seen["recommendations"]["daily_stats"] == "daily_stats-result"
+
+
+def test_results_are_handed_to_later_stages(monkeypatch):
+    _, seen = _stub_stages(monkeypatch)
+
+    run_pipeline(engine=None, max_workers=1)
+
+    assert seen["daily_stats"] == {}
+    assert seen["insights_snapshots"]["recommendations"] == "recommendations-result"
+    assert seen["insights_snapshots"]["cluster_users"] == "cluster_users-result"
+
+
+def test_independent_stages_run_in_parallel(monkeypatch):
+    log, _ = _stub_stages(monkeypatch, sleep=0.05)
+
+    run_pipeline(engine=None, max_workers=2)
+
+    # recommendations and cluster_users both only wait for daily_features
+    first_end = min(_position(log, "end", "recommendations"), _position(log, "end", "cluster_users"))
+    assert _position(log, "start", "recommendations") < first_end
+    assert _position(log, "start", "cluster_users") < first_end
+
+
+def test_serial_with_one_worker(monkeypatch):
+    log, _ = _stub_stages(monkeypatch)
+
+    run_pipeline(engine=None, max_workers=1)
+
+    # every stage ends before the next one starts
+    assert [event for event, _ in log] == ["start", "end"] * len(STAGES)
+
+
+@pytest.mark.parametrize("failed, skipped", [
+    ("daily_features", {"recommendations", "cluster_users", "insights_snapshots"}),
+    ("cluster_users", {"insights_snapshots"}),
+    ("daily_stats", {"daily_features", "recommendations", "cluster_users", "insights_snapshots"}),
+])
+def test_dependents_of_a_failed_stage_are_skipped(monkeypatch, failed, skipped):
+    log, _ = _stub_stages(monkeypatch, fail={failed})
+
+    report = run_pipeline(engine=None, max_workers=2)
+
+    statuses = {name: status for name, (status, _) in report.items()}
+    assert statuses[failed] == "failed"
+    assert {name for name, status in statuses.items() if status == "skipped"} == skipped
+    assert all(("start", name) not in log for name in skipped)
+    assert set(statuses) == set(STAGES)
@@ -0,0 +1,103 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+from events import Event, day_start_for
+from lag_sketch import bucket_index
+from realtime_worker import handle_events
+
+
+def _event(event_type, user_id, task_id, at):
+    return Event(f"ev-{event_type}-{task_id}", event_type, user_id, task_id, at, day_start_for(at))
+
+
+def _lag_row(conn, user_id, day):
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT "completionLagSumH", "completionLagCount", "avgCompletionLagH", "completionLagSketch"
+            FROM "DailyUserFeatures"
+            WHERE "userId" = %s AND day = %s
+            """,
+            (user_id, day),
+        )
+        return cur.fetchone()
+
+
+def _now():
+    # keep created and completed on the same UTC day so the window stays simple
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    return max(now, day_start_for(now) + timedelta(hours=4))
+
+
+def test_created_then_completed_folds_lag(conn, user_id):
+    completed_at = _now()
+    created_at = completed_at - timedelta(hours=3)
+
+    handle_events(conn, [_event("TASK_CREATED", user_id, "task-1", created_at)])
+    conn.commit()
+    handle_events(conn, [_event("TASK_COMPLETED", user_id, "task-1", completed_at)])
+    conn.commit()
+
+    lag_sum, lag_count, avg_lag, sketch = _lag_row(conn, user_id, day_start_for(completed_at))
+    assert lag_count == 1
+    assert abs(lag_sum - 3.0) < 1e-6
+    assert abs(avg_lag - 3.0) < 1e-6
+    assert sum(sketch) == 1
+    assert sketch[bucket_index(3.0)] == 1
+
+
+def test_created_and_completed_in_one_batch(conn, user_id):
+    # a v2 entry decodes to several events handled together
+    completed_at = _now()
+    events = [
+        _event("TASK_CREATED", user_id, "task-a", completed_at - timedelta(hours=2)),
+        _event("TASK_CREATED", user_id, "task-b", completed_at - timedelta(hours=1)),
+        _event("TASK_COMPLETED", user_id, "task-a", completed_at),
+        _event("TASK_COMPLETED", user_id, "task-b", completed_at),
+        _event("TASK_COMPLETED", user_id, "task-a", completed_at),  # duplicate completion is not re-folded
+    ]
+    handle_events(conn, events)
+    conn.commit()
+
+    lag_sum, lag_count, avg_lag, sketch = _lag_row(conn, user_id, day_start_for(completed_at))
+    assert lag_count == 2
+    assert abs(lag_sum - 3.0) < 1e-6
+    assert abs(avg_lag - 1.5) < 1e-6
+    assert sum(sketch) == 2
+
+
+def _segment_row(conn, user_id):
+    with conn.cursor() as cur:
+        cur.execute('SELECT segment, label, centroid, "featuresRef" FROM "UserSegment" WHERE "userId" = %s', (user_id,))
+        return cur.fetchone()
+
+
+def test_segment_follows_latest_model(conn, user_id):
+    # the model's numbering, not the rule-based 0-4, so cluster_users does not see a change
+    features = ["createdCount", "completionRate"]
+    centroids = [
+        {"segment": 7, "label": "Overplanner", "centroid": {"createdCount": 1.0, "completionRate": 0.0}},
+        {"segment": 3, "label": "Finisher", "centroid": {"createdCount": 40.0, "completionRate": 0.9}},
+    ]
+    version = f"test-{user_id}"
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO "SegmentModel" (id, k, centroids, "featuresRef", "lastUsedAt")
+            VALUES (%s, 2, %s::jsonb, %s::jsonb, now() + interval '1 day')
+            """,
+            (version, json.dumps(centroids), json.dumps({"features": features, "mean": [20.0, 0.5], "scale": [10.0, 0.5]})),
+        )
+    conn.commit()
+    try:
+        handle_events(conn, [_event("TASK_CREATED", user_id, "task-s", _now())])
+        conn.commit()
+
+        segment, label, centroid, ref = _segment_row(conn, user_id)
+        assert (segment, label) == (7, "Overplanner")
+        assert centroid is None
+        assert ref["model"] == version
+    finally:
+        with conn.cursor() as cur:
+            cur.execute('DELETE FROM "SegmentModel" WHERE id = %s', (version,))
+        conn.commit()
@@ -0,0 +1,74 @@
+import os
+import uuid
+from datetime import timedelta
+
+import psycopg
+
+from lag_sketch import bucket_index, empty
+from recommendations_v1 import load_inputs, load_lag_sketches, utc_now
+from events import day_start_for
+
+
+def _sketch(lag_h, n=1):
+    s = empty()
+    s[bucket_index(lag_h)] = n
+    return s
+
+
+def _insert_features(conn, user_id, day, sketch):
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO "DailyUserFeatures" (
+              id, "userId", day, "completionLagSumH", "completionLagCount", "completionLagSketch", "updatedAt"
+            )
+            VALUES (%s, %s, %s, 1, %s, %s, now())
+            """,
+            (str(uuid.uuid4()), user_id, day, sum(sketch), sketch),
+        )
+
+
+def test_today_sketches_come_from_daily_features_results(conn, user_id):
+    today = day_start_for(utc_now())
+    _insert_features(conn, user_id, today - timedelta(days=1), _sketch(2.0))
+    _insert_features(conn, user_id, today, _sketch(5.0, n=9))  # stale: replaced by today_features
+    conn.commit()
+
+    start_day = today - timedelta(days=7)
+    today_features = {user_id: {"completionLagCount": 2, "completionLagSketch": _sketch(100.0, n=2)}}
+
+    with conn.cursor() as cur:
+        merged = load_lag_sketches(cur, start_day, today_features)[user_id]
+        from_table = load_lag_sketches(cur, start_day)[user_id]
+
+    assert sum(merged) == 3
+    assert merged[bucket_index(2.0)] == 1
+    assert merged[bucket_index(100.0)] == 2
+    assert merged[bucket_index(5.0)] == 0
+    assert sum(from_table) == 10
+
+
+def test_today_is_read_on_the_primary(conn, user_id):
+    # today's rows are written but not committed on conn: a replica (read_conn) cannot see them yet
+    today = day_start_for(utc_now())
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO "DailyUserStats" (id, "userId", day, "createdCount", "completedCount", "completionRate", "updatedAt")
+            VALUES (%s, %s, %s, 4, 1, 0.25, now()), (%s, %s, %s, 6, 3, 0.5, now())
+            """,
+            (str(uuid.uuid4()), user_id, today - timedelta(days=1), str(uuid.uuid4()), user_id, today),
+        )
+    conn.commit()
+    with conn.cursor() as cur:
+        cur.execute('UPDATE "DailyUserStats" SET "createdCount" = 8, "completedCount" = 2 WHERE "userId" = %s AND day = %s',
+                    (user_id, today))
+    _insert_features(conn, user_id, today, _sketch(100.0, n=3))
+
+    with psycopg.connect(os.environ["DATABASE_URL"], autocommit=True) as replica:
+        rows, sketches = load_inputs(conn, today - timedelta(days=7), read_conn=replica)
+
+    [(_, created, completed, avg_rate)] = [r for r in rows if r[0] == user_id]
+    assert (created, completed) == (12, 3)
+    assert abs(avg_rate - (0.25 + 0.25) / 2) < 1e-9
+    assert sum(sketches[user_id]) == 3
@@ -0,0 +1,22 @@
+from segment_model import nearest_segment
+
+MODEL = {
+    "id": "m1",
+    "features": ["createdCount", "completionRate"],
+    "mean": [20.0, 0.5],
+    "scale": [20.0, 0.1],
+    "centroids": [
+        {"segment": 2, "label": "Overplanner", "centroid": {"createdCount": 40.0, "completionRate": 0.3}},
+        {"segment": 5, "label": "Finisher", "centroid": {"createdCount": 10.0, "completionRate": 0.8}},
+    ],
+}
+
+
+def test_nearest_segment_uses_standardized_distance():
+    # closer to Overplanner in raw createdCount, but the completion rate dominates once scaled
+    assert nearest_segment(MODEL, {"createdCount": 35.0, "completionRate": 0.75}) == (5, "Finisher")
+    assert nearest_segment(MODEL, {"createdCount": 12.0, "completionRate": 0.35}) == (2, "Overplanner")
+
+
+def test_nearest_segment_treats_missing_features_as_zero():
+    assert nearest_segment(MODEL, {}) == (2, "Overplanner")
@@ -0,0 +1,196 @@
+import argparse
+import json
+import os
+import threading
+import time
+import uuid
+
+import fakeredis
+import pytest
+
+from events import decode_entry
+from realtime_worker import handle_events
+from stream_replay import (
+    Anonymiser, anonymise_entry, backlog_sample, replay, seed, seed_rows, send_offsets,
+)
+from test_events import V2_FIELDS
+
+STREAM = "timeflow.events"
+GROUP = "realtime-features"
+DLQ = "timeflow.events.dlq"
+
+V1_FIELDS = {
+    "version": "1", "eventId": "ev9", "type": "TASK_COMPLETED", "userId": "u1",
+    "createdAt": "2026-01-14T18:00:00.000Z", "taskId": "t1",
+}
+
+
+@pytest.fixture
+def r():
+    client = fakeredis.FakeRedis(decode_responses=True)
+    client.xgroup_create(STREAM, GROUP, id="0-0", mkstream=True)
+    return client
+
+
+def _entries(*offsets_ms, base=1_768_400_000_000):
+    return [{"id": f"{base + ms}-0", "fields": {**V1_FIELDS, "eventId": f"ev{i}"}} for i, ms in enumerate(offsets_ms)]
+
+
+def test_anonymiser_is_stable_within_a_key():
+    a = Anonymiser("salt")
+    assert a("u1") == a("u1") == Anonymiser("salt")("u1")
+    assert a("u1") != a("u2")
+    assert a("u1") != Anonymiser("other")("u1")
+    assert a("u1").startswith("anon_") and "u1" not in a("u1")
+    assert a(None) is None and a("") == ""
+
+
+def test_anonymise_v1_entry():
+    anon = Anonymiser("salt")
+    out = anonymise_entry(V1_FIELDS, anon)
+
+    assert out["version"] == "1"
+    assert (out["userId"], out["taskId"], out["eventId"]) == (anon("u1"), anon("t1"), anon("ev9"))
+    assert (out["type"], out["createdAt"]) == ("TASK_COMPLETED", "2026-01-14T18:00:00.000Z")
+
+
+def test_anonymise_v2_entry_keeps_the_batch():
+    anon = Anonymiser("salt")
+    out = anonymise_entry(V2_FIELDS, anon)
+
+    assert (out["version"], out["count"]) == ("2", "3")
+    before, after = decode_entry(V2_FIELDS), decode_entry(out)
+    assert [e.user_id for e in after] == [anon(e.user_id) for e in before]
+    assert [e.task_id for e in after] == [anon("t1"), anon("t1"), None]
+    assert [(e.type, e.created_at) for e in after] == [(e.type, e.created_at) for e in before]
+    # the same user in a v1 entry maps to the same id (per-user skew is kept across encodings)
+    assert anonymise_entry(V1_FIELDS, anon)["userId"] == after[0].user_id
+
+
+def test_anonymise_skips_unknown_version():
+    assert anonymise_entry({"version": "9"}, Anonymiser("salt")) is None
+
+
+def test_send_offsets_scale_captured_spacing():
+    entries = _entries(0, 500, 2000)
+    assert send_offsets(entries, 1.0) == [0.0, 0.5, 2.0]
+    assert send_offsets(entries, 10.0) == [0.0, 0.05, 0.2]
+    assert send_offsets(entries, "max") == [0.0, 0.0, 0.0]
+    assert send_offsets([], 2.0) == []
+
+
+def test_backlog_sample(r):
+    assert backlog_sample(r, STREAM, "missing") == (None, None, None)
+
+    for _ in range(3):
+        r.xadd(STREAM, V1_FIELDS)
+    backlog, age, failed = backlog_sample(r, STREAM, GROUP)
+    assert (backlog, failed) == (3, 0)  # all undelivered (lag)
+    assert age >= 0.0
+
+    [(_, delivered)] = r.xreadgroup(GROUP, "c1", {STREAM: ">"}, count=2)
+    assert backlog_sample(r, STREAM, GROUP)[::2] == (3, 0)  # 2 pending + 1 lag
+
+    r.xack(STREAM, GROUP, delivered[0][0])
+    assert backlog_sample(r, STREAM, GROUP)[::2] == (2, 0)
+
+    # an unacked delivery older than stuck_after is a failure, not backlog
+    time.sleep(0.02)
+    assert backlog_sample(r, STREAM, GROUP, stuck_after=0.01)[::2] == (1, 1)
+
+
+def _consume(r, stop, fail_event_ids=()):
+    # stands in for realtime_worker: acks what it handles, leaves failures pending, never re-reads them
+    while not stop.is_set():
+        for _, messages in r.xreadgroup(GROUP, "c1", {STREAM: ">"}, count=10, block=10) or ():
+            for msg_id, fields in messages:
+                if fields.get("eventId") not in fail_event_ids:
+                    r.xack(STREAM, GROUP, msg_id)
+
+
+def _replay_with_consumer(r, entries, speed, fail_event_ids=()):
+    stop = threading.Event()
+    consumer = threading.Thread(target=_consume, args=(r, stop, fail_event_ids), daemon=True)
+    consumer.start()
+    try:
+        return replay(r, entries, speed, STREAM, GROUP, drain_timeout=2.0, stuck_after=0.2, dlq_stream=DLQ)
+    finally:
+        stop.set()
+        consumer.join()
+
+
+def test_replay_paces_entries_by_speed(r):
+    entries = _entries(0, 100, 200, 300)
+
+    started = time.monotonic()
+    res = _replay_with_consumer(r, entries, 2.0)
+    took = time.monotonic() - started
+
+    assert took >= 0.15  # last entry is due at 300ms / 2
+    assert res["entries"] == 4 and res["drainedAfterSec"] is not None
+    assert res["failedDeliveries"] == 0 and res["deadLettered"] == 0
+    assert [f["eventId"] for _, f in r.xrange(STREAM)] == ["ev0", "ev1", "ev2", "ev3"]
+
+
+def test_replay_counts_unacked_deliveries_as_failures(r):
+    res = _replay_with_consumer(r, _entries(0, 1, 2), "max", fail_event_ids={"ev1"})
+
+    assert res["failedDeliveries"] == 1
+    assert res["drainedAfterSec"] is not None  # the stuck entry is not backlog
+    # a second run does not count the first run's failure again
+    res = _replay_with_consumer(r, _entries(0, 1), "max")
+    assert res["failedDeliveries"] == 0
+
+
+def test_replay_counts_dead_lettered_entries(r):
+    r.xadd(DLQ, {"msgId": "old", "error": "before this run"})
+    stop = threading.Event()
+
+    def dead_letter():
+        while not stop.is_set():
+            for _, messages in r.xreadgroup(GROUP, "c1", {STREAM: ">"}, count=10, block=10) or ():
+                for msg_id, fields in messages:
+                    r.xadd(DLQ, {"msgId": msg_id, **fields, "error": "malformed"})
+                    r.xack(STREAM, GROUP, msg_id)
+
+    consumer = threading.Thread(target=dead_letter, daemon=True)
+    consumer.start()
+    try:
+        res = replay(r, _entries(0, 1), "max", STREAM, GROUP, drain_timeout=2.0, stuck_after=0.2, dlq_stream=DLQ)
+    finally:
+        stop.set()
+        consumer.join()
+
+    assert res["deadLettered"] == 2
+
+
+def test_seeded_capture_replays_through_realtime_worker(conn, tmp_path):
+    anon = Anonymiser(uuid.uuid4().hex)
+    entries = [
+        {"id": "1-0", "fields": anonymise_entry(V2_FIELDS, anon)},
+        {"id": "2-0", "fields": anonymise_entry(V1_FIELDS, anon)},
+    ]
+    users, tasks, task_events = seed_rows(entries)
+    assert sorted(users) == sorted({anon("u1"), anon("u2")})
+    assert tasks == [(anon("t1"), anon("u1"))]
+    assert len(task_events) == 4
+
+    capture = tmp_path / "capture.jsonl"
+    capture.write_text("".join(json.dumps(e) + "\n" for e in entries))
+    try:
+        seed(argparse.Namespace(capture=str(capture), database_url=os.environ["DATABASE_URL"]))
+        seed(argparse.Namespace(capture=str(capture), database_url=os.environ["DATABASE_URL"]))  # idempotent
+
+        with conn.cursor() as cur:
+            cur.execute('SELECT COUNT(*) FROM "TaskEvent" WHERE "userId" = ANY(%s)', (users,))
+            assert cur.fetchone()[0] == 4
+
+        # without the seeded rows this fails on the User foreign key
+        for e in entries:
+            handle_events(conn, decode_entry(e["fields"]))
+        conn.commit()
+    finally:
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute('DELETE FROM "User" WHERE id = ANY(%s)', (users,))
+        conn.commit()
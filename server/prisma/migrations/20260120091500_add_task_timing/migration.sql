@@ -0,0 +1,55 @@
+-- AlterTable
+ALTER TABLE "DailyUserFeatures" ADD COLUMN     "completionLagCount" INTEGER NOT NULL DEFAULT 0,
+ADD COLUMN     "completionLagSumH" DOUBLE PRECISION NOT NULL DEFAULT 0;
+
+-- CreateTable
+CREATE TABLE "TaskTiming" (
+    "taskId" TEXT NOT NULL,
+    "userId" TEXT NOT NULL,
+    "createdAt" TIMESTAMP(3) NOT NULL,
+    "completedAt" TIMESTAMP(3),
+
+    CONSTRAINT "TaskTiming_pkey" PRIMARY KEY ("taskId")
+);
+
+-- CreateIndex
+CREATE INDEX "TaskTiming_userId_completedAt_idx" ON "TaskTiming"("userId", "completedAt");
+
+-- CreateIndex
+CREATE INDEX "TaskTiming_completedAt_idx" ON "TaskTiming"("completedAt");
+
+-- AddForeignKey
+ALTER TABLE "TaskTiming" ADD CONSTRAINT "TaskTiming_userId_fkey" FOREIGN KEY ("userId") REFERENCES "User"("id") ON DELETE CASCADE ON UPDATE CASCADE;
+
+-- Backfill from existing events
+INSERT INTO "TaskTiming" ("taskId", "userId", "createdAt", "completedAt")
+SELECT c."taskId", c."userId", c.c_at, d.d_at
+FROM (
+  SELECT "taskId", "userId", MIN("createdAt") AS c_at
+  FROM "TaskEvent"
+  WHERE type = 'TASK_CREATED' AND "taskId" IS NOT NULL
+  GROUP BY "taskId", "userId"
+) c
+LEFT JOIN (
+  SELECT "taskId", MIN("createdAt") AS d_at
+  FROM "TaskEvent"
+  WHERE type = 'TASK_COMPLETED' AND "taskId" IS NOT NULL
+  GROUP BY "taskId"
+) d USING ("taskId")
+ON CONFLICT ("taskId") DO NOTHING;
+
+-- Fold the backfilled completions into existing rows (per completion day, as the workers do)
+UPDATE "DailyUserFeatures" f
+SET "completionLagSumH" = t.lag_sum,
+    "completionLagCount" = t.lag_count,
+    "avgCompletionLagH" = t.lag_sum / t.lag_count
+FROM (
+    SELECT "userId",
+           date_trunc('day', "completedAt") AS day,
+           SUM(EXTRACT(EPOCH FROM ("completedAt" - "createdAt")) / 3600.0)::float8 AS lag_sum,
+           COUNT(*)::int AS lag_count
+    FROM "TaskTiming"
+    WHERE "completedAt" IS NOT NULL
+    GROUP BY 1, 2
+) t
+WHERE f."userId" = t."userId" AND f.day = t.day;
@@ -0,0 +1,38 @@
+-- CreateTable
+CREATE TABLE "TaskEventHourly" (
+    "userId" TEXT NOT NULL,
+    "hour" TIMESTAMP(3) NOT NULL,
+    "type" TEXT NOT NULL,
+    "count" INTEGER NOT NULL DEFAULT 0,
+    "firstAt" TIMESTAMP(3) NOT NULL,
+    "lastAt" TIMESTAMP(3) NOT NULL,
+
+    CONSTRAINT "TaskEventHourly_pkey" PRIMARY KEY ("userId","hour","type")
+);
+
+-- CreateTable
+CREATE TABLE "RollupWatermark" (
+    "name" TEXT NOT NULL,
+    "watermark" TIMESTAMP(3) NOT NULL,
+    "updatedAt" TIMESTAMP(3) NOT NULL,
+
+    CONSTRAINT "RollupWatermark_pkey" PRIMARY KEY ("name")
+);
+
+-- CreateIndex
+CREATE INDEX "TaskEventHourly_hour_idx" ON "TaskEventHourly"("hour");
+
+-- CreateIndex
+CREATE INDEX "TaskEvent_createdAt_idx" ON "TaskEvent"("createdAt");
+
+-- AddForeignKey
+ALTER TABLE "TaskEventHourly" ADD CONSTRAINT "TaskEventHourly_userId_fkey" FOREIGN KEY ("userId") REFERENCES "User"("id") ON DELETE CASCADE ON UPDATE CASCADE;
+
+-- Backfill from existing events
+INSERT INTO "TaskEventHourly" ("userId", "hour", "type", "count", "firstAt", "lastAt")
+SELECT "userId", date_trunc('hour', "createdAt"), "type", COUNT(*)::int, MIN("createdAt"), MAX("createdAt")
+FROM "TaskEvent"
+GROUP BY 1, 2, 3;
+
+INSERT INTO "RollupWatermark" ("name", "watermark", "updatedAt")
+VALUES ('TaskEventHourly', date_trunc('hour', now() AT TIME ZONE 'UTC'), CURRENT_TIMESTAMP);
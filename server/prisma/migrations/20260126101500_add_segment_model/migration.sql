@@ -0,0 +1,14 @@
+-- CreateTable
+CREATE TABLE "SegmentModel" (
+    "id" TEXT NOT NULL,
+    "k" INTEGER NOT NULL,
+    "centroids" JSONB NOT NULL,
+    "featuresRef" JSONB,
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "lastUsedAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT "SegmentModel_pkey" PRIMARY KEY ("id")
+);
+
+-- CreateIndex
+CREATE INDEX "SegmentModel_lastUsedAt_idx" ON "SegmentModel"("lastUsedAt");
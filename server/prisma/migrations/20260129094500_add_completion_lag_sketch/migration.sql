@@ -0,0 +1,36 @@
+-- AlterTable
+ALTER TABLE "DailyUserFeatures" ADD COLUMN     "completionLagSketch" INTEGER[] DEFAULT array_fill(0, ARRAY[56]);
+
+-- Backfill sketches from the task timing index (bucketing matches python-workers/src/lag_sketch.py)
+WITH b AS (
+    SELECT "userId",
+           date_trunc('day', "completedAt") AS day,
+           CASE WHEN lag <= 0.016666666666666666 THEN 0
+                ELSE LEAST(55, CEIL(LN(lag / 0.016666666666666666) / LN(1.25))::int) END AS bucket
+    FROM (
+        SELECT "userId", "completedAt",
+               EXTRACT(EPOCH FROM ("completedAt" - "createdAt")) / 3600.0 AS lag
+        FROM "TaskTiming"
+        WHERE "completedAt" IS NOT NULL
+    ) t
+),
+c AS (
+    SELECT "userId", day, bucket, COUNT(*)::int AS n
+    FROM b
+    GROUP BY 1, 2, 3
+),
+s AS (
+    SELECT "userId", day,
+           ARRAY(
+               SELECT COALESCE(MAX(c2.n), 0)
+               FROM generate_series(0, 55) g(i)
+               LEFT JOIN c c2 ON c2."userId" = c1."userId" AND c2.day = c1.day AND c2.bucket = g.i
+               GROUP BY g.i
+               ORDER BY g.i
+           ) AS sketch
+    FROM (SELECT DISTINCT "userId", day FROM c) c1
+)
+UPDATE "DailyUserFeatures" f
+SET "completionLagSketch" = s.sketch
+FROM s
+WHERE f."userId" = s."userId" AND f.day = s.day;
@@ -0,0 +1,3 @@
+-- Centroids live on SegmentModel. Per-row centroids were written by the realtime worker's
+-- rule-based segments and would otherwise shadow the model's centroid forever.
+UPDATE "UserSegment" SET "centroid" = NULL WHERE "centroid" IS NOT NULL;
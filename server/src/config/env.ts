@@ -10,6 +10,11 @@ const envSchema = z.object({
   OPS_ENABLED: z.coerce.boolean().default(false),
   OPS_DEV_ONLY: z.coerce.boolean().default(true),
   OPS_ADMIN_EMAILS: z.string().optional(),
+  // explicit parse: z.coerce.boolean() would read 'false' as true
+  EVENTS_BATCH_V2: z
+    .enum(['true', 'false'])
+    .default('false')
+    .transform((v) => v === 'true'),
 });
 
 const parsed = envSchema.safeParse(process.env);
@@ -0,0 +1,37 @@
+// Stream entry encodings for timeflow.events (see docs/EVENTS_CONTRACT.md).
+// Decoded on the worker side by python-workers/src/events.py.
+
+export type StreamEvent = {
+  id: string;
+  type: string;
+  userId: string;
+  taskId: string | null;
+  createdAt: Date;
+};
+
+export function encodeV1Fields(ev: StreamEvent): Record<string, string> {
+  const fields: Record<string, string> = {
+    version: '1',
+    eventId: ev.id,
+    type: ev.type,
+    userId: ev.userId,
+    createdAt: ev.createdAt.toISOString(),
+  };
+  if (ev.taskId) {
+    fields.taskId = ev.taskId;
+  }
+  return fields;
+}
+
+// One record per line: eventId \t type \t userId \t taskId \t createdAt (epoch ms)
+export function encodeV2(events: StreamEvent[]) {
+  return events
+    .map((ev) =>
+      [ev.id, ev.type, ev.userId, ev.taskId ?? '', String(ev.createdAt.getTime())].join('\t'),
+    )
+    .join('\n');
+}
+
+export function encodeV2Fields(events: StreamEvent[]): Record<string, string> {
+  return { version: '2', count: String(events.length), events: encodeV2(events) };
+}
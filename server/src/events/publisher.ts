@@ -1,8 +1,17 @@
 import { redis } from '../queue/redis';
 import { prisma } from '../db/prisma';
+import { env } from '../config/env';
+import { encodeV1Fields, encodeV2Fields, type StreamEvent } from './encoding';
 
 const STREAM = 'timeflow.events';
 
+// v2 batching (see docs/EVENTS_CONTRACT.md)
+const V2_MAX_BATCH = 50;
+const V2_FLUSH_MS = 20;
+
+let pendingV2: StreamEvent[] = [];
+let flushTimer: NodeJS.Timeout | null = null;
+
 export async function publishEventById(eventId: string) {
   const ev = await prisma.taskEvent.findUnique({
     where: { id: eventId },
@@ -19,20 +28,72 @@ export async function publishEventById(eventId: string) {
     return;
   }
 
-  const fields: Record<string, string> = {
-    version: '1',
-    eventId: ev.id,
-    type: ev.type,
-    userId: ev.userId,
-    createdAt: ev.createdAt.toISOString(),
-  };
-  if (ev.taskId) {
-    fields.taskId = ev.taskId;
+  if (env.EVENTS_BATCH_V2) {
+    enqueueV2(ev);
+    return;
   }
 
+  const fields = encodeV1Fields(ev);
+
   try {
     await redis.xadd(STREAM, '*', ...Object.entries(fields).flat());
   } catch (e) {
     console.error('[publisher] redis xadd failed', e);
   }
 }
+
+function enqueueV2(ev: StreamEvent) {
+  pendingV2.push(ev);
+
+  if (pendingV2.length >= V2_MAX_BATCH) {
+    void flushPendingEvents();
+    return;
+  }
+
+  if (!flushTimer) {
+    flushTimer = setTimeout(() => void flushPendingEvents(), V2_FLUSH_MS);
+  }
+}
+
+export async function flushPendingEvents() {
+  if (flushTimer) {
+    clearTimeout(flushTimer);
+    flushTimer = null;
+  }
+
+  if (!pendingV2.length) {
+    return;
+  }
+
+  const batch = pendingV2;
+  pendingV2 = [];
+
+  try {
+    await redis.xadd(STREAM, '*', ...Object.entries(encodeV2Fields(batch)).flat());
+  } catch (e) {
+    logDropped(batch, 'redis xadd (v2 batch) failed', e);
+  }
+}
+
+function logDropped(events: StreamEvent[], reason: string, err?: unknown) {
+  // the TaskEvent rows are still in Postgres; these ids are what never reached the stream
+  console.error(
+    `[publisher] dropped ${events.length} event(s): ${reason}`,
+    events.map((ev) => ev.id),
+    ...(err ? [err] : []),
+  );
+}
+
+// Synchronous last resort (process 'exit'): anything still buffered cannot be sent.
+export function discardPendingEvents(reason: string) {
+  if (flushTimer) {
+    clearTimeout(flushTimer);
+    flushTimer = null;
+  }
+  if (!pendingV2.length) {
+    return;
+  }
+  const batch = pendingV2;
+  pendingV2 = [];
+  logDropped(batch, reason);
+}
@@ -1,9 +1,24 @@
 import 'dotenv/config';
 import { createServer } from './app/server';
 import { env } from './config/env';
+import { discardPendingEvents, flushPendingEvents } from './events/publisher';
 
 const app = createServer();
 app.listen(env.PORT, () => {
   // eslint-disable-next-line no-console
   console.log(`Server listening on http://localhost:${env.PORT}`);
 });
+
+// Flush buffered v2 events before exiting; whatever is still buffered at 'exit'
+// (e.g. after an uncaught exception) is logged by id.
+for (const signal of ['SIGTERM', 'SIGINT'] as const) {
+  process.on(signal, () => {
+    void flushPendingEvents().finally(() => process.exit(0));
+  });
+}
+process.on('beforeExit', () => {
+  void flushPendingEvents();
+});
+process.on('exit', (code) => {
+  discardPendingEvents(`process exiting (code ${code})`);
+});
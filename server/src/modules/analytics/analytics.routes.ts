@@ -2,6 +2,7 @@ import { Router } from 'express';
 import { z } from 'zod';
 import { prisma } from '../../db/prisma';
 import { requireAuth, AuthedRequest } from '../../app/middleware/require-auth';
+import { getInsightsSnapshot } from '../insights/insights.snapshot';
 
 export const analyticsRouter = Router();
 analyticsRouter.use(requireAuth);
@@ -40,50 +41,15 @@ analyticsRouter.get('/daily', async (req: AuthedRequest, res, next) => {
 analyticsRouter.get('/summary', async (req: AuthedRequest, res, next) => {
   try {
     const userId = req.user!.id;
-    const now = new Date();
 
-    const [total, done, pending, canceled, overdue, latestStats, latestFeatures] =
-      await Promise.all([
-        prisma.task.count({ where: { userId } }),
-        prisma.task.count({ where: { userId, status: 'DONE' } }),
-        prisma.task.count({ where: { userId, status: 'PENDING' } }),
-        prisma.task.count({ where: { userId, status: 'CANCELED' } }),
-        prisma.task.count({
-          where: {
-            userId,
-            status: 'PENDING',
-            dueAt: { lt: now },
-          },
-        }),
-        prisma.dailyUserStats.findFirst({
-          where: { userId },
-          orderBy: { day: 'desc' },
-          select: {
-            day: true,
-            createdCount: true,
-            completedCount: true,
-            completionRate: true,
-            updatedAt: true,
-          },
-        }),
-        prisma.dailyUserFeatures.findFirst({
-          where: { userId },
-          orderBy: { day: 'desc' },
-        }),
-      ]);
+    const { snap, source } = await getInsightsSnapshot(userId);
 
+    res.set('X-Insights-Source', source);
     res.json({
       ok: true,
-      taskSummary: {
-        total,
-        done,
-        pending,
-        canceled,
-        overdue,
-        completionRate: total > 0 ? Number((done / total).toFixed(3)) : 0,
-      },
-      latestDailyStats: latestStats ?? null,
-      latestDailyFeatures: latestFeatures ?? null,
+      taskSummary: snap.taskSummary,
+      latestDailyStats: snap.latestDailyStats,
+      latestDailyFeatures: snap.latestDailyFeatures,
     });
   } catch (err) {
     next(err);
@@ -0,0 +1,215 @@
+import { prisma } from '../../db/prisma';
+import { redis } from '../../queue/redis';
+
+// Written by python-workers (src/insights_snapshot.py) and by the API on a miss.
+// Keep key/version/TTL and the guarded write in sync with the worker.
+const SNAPSHOT_KEY_PREFIX = 'timeflow:insights:v1:';
+const SNAPSHOT_GEN_PREFIX = 'timeflow:insights:gen:';
+const SNAPSHOT_VERSION = 1;
+const SNAPSHOT_TTL_SEC = 600;
+const SNAPSHOT_GEN_TTL_SEC = 86400;
+
+// SET the snapshot only if the user's generation is still the one read before it was built,
+// so a snapshot built from pre-mutation rows cannot land after an invalidation.
+const SET_IF_GENERATION_LUA = `
+local gen = redis.call('GET', KEYS[2]) or ''
+if gen ~= ARGV[1] then return 0 end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+`;
+
+export type InsightsSnapshot = {
+  version: number;
+  userId: string;
+  generatedAt: string;
+  taskSummary: {
+    total: number;
+    done: number;
+    pending: number;
+    canceled: number;
+    overdue: number;
+    completionRate: number;
+  };
+  segment: {
+    segment: number;
+    label: string;
+    updatedAt: string;
+    featuresRef: unknown;
+  } | null;
+  latestDailyStats: Record<string, unknown> | null;
+  latestDailyFeatures: Record<string, unknown> | null;
+  recommendations: Array<{
+    id: string;
+    message: string;
+    evidence: unknown;
+    expiresAt: string | null;
+    updatedAt: string;
+  }>;
+};
+
+export function snapshotKey(userId: string) {
+  return `${SNAPSHOT_KEY_PREFIX}${userId}`;
+}
+
+export function snapshotGenerationKey(userId: string) {
+  return `${SNAPSHOT_GEN_PREFIX}${userId}`;
+}
+
+// Returns null on miss, version mismatch or Redis error; callers fall back to Postgres.
+export async function readInsightsSnapshot(userId: string): Promise<InsightsSnapshot | null> {
+  try {
+    const raw = await redis.get(snapshotKey(userId));
+    if (!raw) {
+      return null;
+    }
+
+    const snap = JSON.parse(raw) as InsightsSnapshot;
+    if (snap.version !== SNAPSHOT_VERSION || snap.userId !== userId) {
+      return null;
+    }
+
+    return snap;
+  } catch (e) {
+    console.error('[insights] snapshot read failed', e);
+    return null;
+  }
+}
+
+// Read before building a snapshot; '' when the user has no generation yet. null on Redis error.
+export async function readSnapshotGeneration(userId: string): Promise<string | null> {
+  try {
+    return (await redis.get(snapshotGenerationKey(userId))) ?? '';
+  } catch (e) {
+    console.error('[insights] snapshot generation read failed', e);
+    return null;
+  }
+}
+
+// Builds the snapshot from Postgres (same shape as the worker's build_snapshot).
+export async function buildInsightsSnapshot(userId: string): Promise<InsightsSnapshot> {
+  const now = new Date();
+
+  const [
+    segment,
+    latestStats,
+    latestFeatures,
+    recommendations,
+    total,
+    done,
+    pending,
+    canceled,
+    overdue,
+  ] = await Promise.all([
+    prisma.userSegment.findUnique({
+      where: { userId },
+      select: { segment: true, label: true, updatedAt: true, featuresRef: true },
+    }),
+    prisma.dailyUserStats.findFirst({
+      where: { userId },
+      orderBy: { day: 'desc' },
+      select: {
+        day: true,
+        createdCount: true,
+        completedCount: true,
+        completionRate: true,
+        updatedAt: true,
+      },
+    }),
+    prisma.dailyUserFeatures.findFirst({
+      where: { userId },
+      orderBy: { day: 'desc' },
+    }),
+    prisma.userRecommendation.findMany({
+      where: { userId },
+      orderBy: { createdAt: 'desc' },
+      take: 5,
+      select: { id: true, message: true, evidence: true, expiresAt: true, updatedAt: true },
+    }),
+
+    prisma.task.count({ where: { userId } }),
+    prisma.task.count({ where: { userId, status: 'DONE' } }),
+    prisma.task.count({ where: { userId, status: 'PENDING' } }),
+    prisma.task.count({ where: { userId, status: 'CANCELED' } }),
+    prisma.task.count({
+      where: {
+        userId,
+        status: 'PENDING',
+        dueAt: { lt: now },
+      },
+    }),
+  ]);
+
+  // round-trip through JSON so Dates are ISO strings, as in the cached document
+  return JSON.parse(
+    JSON.stringify({
+      version: SNAPSHOT_VERSION,
+      userId,
+      generatedAt: now,
+      taskSummary: {
+        total,
+        done,
+        pending,
+        canceled,
+        overdue,
+        completionRate: total > 0 ? Number((done / total).toFixed(3)) : 0,
+      },
+      segment: segment ?? null,
+      latestDailyStats: latestStats ?? null,
+      latestDailyFeatures: latestFeatures ?? null,
+      recommendations,
+    }),
+  ) as InsightsSnapshot;
+}
+
+// Returns true if written; false if the user was invalidated since `generation` was read.
+export async function writeInsightsSnapshot(snap: InsightsSnapshot, generation: string | null) {
+  if (generation === null) {
+    return false;
+  }
+  try {
+    const written = await redis.eval(
+      SET_IF_GENERATION_LUA,
+      2,
+      snapshotKey(snap.userId),
+      snapshotGenerationKey(snap.userId),
+      generation,
+      JSON.stringify(snap),
+      String(SNAPSHOT_TTL_SEC),
+    );
+    return written === 1;
+  } catch (e) {
+    console.error('[insights] snapshot write failed', e);
+    return false;
+  }
+}
+
+// Cached snapshot, or build it from Postgres and cache it (the DB path fills the cache).
+export async function getInsightsSnapshot(
+  userId: string,
+): Promise<{ snap: InsightsSnapshot; source: 'snapshot' | 'db' }> {
+  const cached = await readInsightsSnapshot(userId);
+  if (cached) {
+    return { snap: cached, source: 'snapshot' };
+  }
+
+  const generation = await readSnapshotGeneration(userId);
+  const snap = await buildInsightsSnapshot(userId);
+  await writeInsightsSnapshot(snap, generation);
+  return { snap, source: 'db' };
+}
+
+// Task mutations change the task summary: bump the generation (in-flight builds will not be
+// stored) and drop the snapshot so the next read goes to Postgres.
+export async function invalidateInsightsSnapshot(userId: string) {
+  const genKey = snapshotGenerationKey(userId);
+  try {
+    await redis
+      .multi()
+      .incr(genKey)
+      .expire(genKey, SNAPSHOT_GEN_TTL_SEC)
+      .del(snapshotKey(userId))
+      .exec();
+  } catch (e) {
+    console.error('[insights] snapshot invalidate failed', e);
+  }
+}
@@ -0,0 +1,26 @@
+import type { Prisma } from '@prisma/client';
+import { prisma } from '../../db/prisma';
+
+type ModelCentroid = { segment: number; label: string; centroid: Record<string, number> };
+
+// UserSegment rows do not carry a centroid; it lives once per model version on SegmentModel.
+// Use the model the row was assigned with (featuresRef.model), else the latest one.
+export async function resolveCentroid(row: {
+  segment: number;
+  featuresRef: Prisma.JsonValue | null;
+}): Promise<Prisma.JsonValue | null> {
+  const ref = row.featuresRef as { model?: unknown } | null;
+  const modelId = typeof ref?.model === 'string' ? ref.model : null;
+
+  const assigned = modelId
+    ? await prisma.segmentModel.findUnique({ where: { id: modelId }, select: { centroids: true } })
+    : null;
+  const model =
+    assigned ??
+    (await prisma.segmentModel.findFirst({
+      orderBy: { lastUsedAt: 'desc' },
+      select: { centroids: true },
+    }));
+  const centroids = (model?.centroids ?? []) as ModelCentroid[];
+  return centroids.find((c) => c.segment === row.segment)?.centroid ?? null;
+}
@@ -1,6 +1,7 @@
 import { Router } from 'express';
 import { prisma } from '../../db/prisma';
 import { requireAuth, AuthedRequest } from '../../app/middleware/require-auth';
+import { resolveCentroid } from './segment.centroid';
 
 export const segmentRouter = Router();
 segmentRouter.use(requireAuth);
@@ -9,10 +10,13 @@ segmentRouter.get('/', async (req: AuthedRequest, res, next) => {
   try {
     const row = await prisma.userSegment.findUnique({
       where: { userId: req.user!.id },
-      select: { segment: true, label: true, centroid: true, featuresRef: true, updatedAt: true },
+      select: { segment: true, label: true, featuresRef: true, updatedAt: true },
     });
 
-    res.json({ ok: true, segment: row });
+    res.json({
+      ok: true,
+      segment: row ? { ...row, centroid: await resolveCentroid(row) } : null,
+    });
   } catch (err) {
     next(err);
   }
@@ -22,14 +26,14 @@ segmentRouter.get('/insights', async (req: AuthedRequest, res, next) => {
   try {
     const row = await prisma.userSegment.findUnique({
       where: { userId: req.user!.id },
-      select: { label: true, centroid: true },
+      select: { segment: true, label: true, featuresRef: true },
     });
 
     if (!row) {
       return res.json({ ok: true, insights: [] });
     }
 
-    const c = (row.centroid as Record<string, unknown>) ?? {};
+    const c = ((await resolveCentroid(row)) as Record<string, unknown>) ?? {};
     const insights: string[] = [];
 
     if (row.label === 'Overplanner') {
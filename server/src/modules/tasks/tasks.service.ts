@@ -2,6 +2,7 @@ import { prisma } from '../../db/prisma';
 import { TaskStatus } from '@prisma/client';
 import type { Prisma } from '@prisma/client';
 import { publishEventById } from '../../events/publisher';
+import { invalidateInsightsSnapshot } from '../insights/insights.snapshot';
 
 type ListParams = {
   userId: string;
@@ -46,6 +47,7 @@ export async function createTask(
     },
     dedupeKey: `TASK_CREATED:${task.id}`,
   });
+  await invalidateInsightsSnapshot(userId);
 
   return task;
 }
@@ -139,6 +141,7 @@ export async function updateTask(userId: string, taskId: string, data: Prisma.Ta
       dedupeKey: `TASK_COMPLETED:${taskId}`,
     });
   }
+  await invalidateInsightsSnapshot(userId);
 
   return updatedTask;
 }
@@ -150,6 +153,7 @@ export async function deleteTask(userId: string, taskId: string) {
   }
 
   await prisma.task.delete({ where: { id: taskId } });
+  await invalidateInsightsSnapshot(userId);
   return true;
 }
 
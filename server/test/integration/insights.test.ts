@@ -0,0 +1,224 @@
+import { describe, it, expect, beforeAll, beforeEach, afterAll } from 'vitest';
+import request from 'supertest';
+import { createServer } from '../../src/app/server';
+import { prisma } from '../../src/db/prisma';
+import { redis } from '../../src/queue/redis';
+import {
+  buildInsightsSnapshot,
+  invalidateInsightsSnapshot,
+  readSnapshotGeneration,
+  snapshotGenerationKey,
+  snapshotKey,
+  writeInsightsSnapshot,
+} from '../../src/modules/insights/insights.snapshot';
+
+const app = createServer();
+
+async function registerAndGetToken(): Promise<{ userId: string; accessToken: string }> {
+  const email = `insights-${Date.now()}-${Math.random().toString(36).slice(2)}@example.com`;
+  const res = await request(app)
+    .post('/auth/register')
+    .send({ email, password: 'password123', name: 'Insights User' });
+  const { user, accessToken } = res.body;
+  return { userId: user.id, accessToken };
+}
+
+function workerSnapshot(userId: string, overrides: Record<string, unknown> = {}) {
+  // what python-workers/src/insights_snapshot.py writes
+  return {
+    version: 1,
+    userId,
+    generatedAt: new Date().toISOString(),
+    taskSummary: {
+      total: 42,
+      done: 21,
+      pending: 21,
+      canceled: 0,
+      overdue: 3,
+      completionRate: 0.5,
+    },
+    segment: {
+      segment: 1,
+      label: 'Overplanner',
+      updatedAt: new Date().toISOString(),
+      featuresRef: {},
+    },
+    latestDailyStats: null,
+    latestDailyFeatures: null,
+    recommendations: [],
+    ...overrides,
+  };
+}
+
+describe('Insights snapshots', () => {
+  let accessToken: string;
+  let userId: string;
+
+  beforeAll(async () => {
+    const auth = await registerAndGetToken();
+    accessToken = auth.accessToken;
+    userId = auth.userId;
+  });
+
+  beforeEach(async () => {
+    await redis.del(snapshotKey(userId), snapshotGenerationKey(userId));
+  });
+
+  afterAll(async () => {
+    await redis.del(snapshotKey(userId), snapshotGenerationKey(userId));
+    await prisma.task.deleteMany({ where: { userId } });
+    await prisma.user.deleteMany({ where: { id: userId } });
+  });
+
+  describe('GET /insights', () => {
+    it('falls back to Postgres on a miss and caches the result', async () => {
+      await prisma.task.create({ data: { userId, title: 'Counted', status: 'DONE' } });
+
+      const res = await request(app)
+        .get('/insights')
+        .set('Authorization', `Bearer ${accessToken}`)
+        .expect(200);
+
+      expect(res.headers['x-insights-source']).toBe('db');
+      expect(res.body.taskSummary).toMatchObject({ total: 1, done: 1, completionRate: 1 });
+
+      const cached = JSON.parse((await redis.get(snapshotKey(userId)))!);
+      expect(cached).toMatchObject({ version: 1, userId, taskSummary: res.body.taskSummary });
+      expect(await redis.ttl(snapshotKey(userId))).toBeGreaterThan(0);
+
+      const again = await request(app)
+        .get('/insights')
+        .set('Authorization', `Bearer ${accessToken}`)
+        .expect(200);
+      expect(again.headers['x-insights-source']).toBe('snapshot');
+      expect(again.body.taskSummary).toEqual(res.body.taskSummary);
+    });
+
+    it('serves a worker-written snapshot', async () => {
+      await redis.set(snapshotKey(userId), JSON.stringify(workerSnapshot(userId)));
+
+      const res = await request(app)
+        .get('/insights')
+        .set('Authorization', `Bearer ${accessToken}`)
+        .expect(200);
+
+      expect(res.headers['x-insights-source']).toBe('snapshot');
+      expect(res.body.taskSummary.total).toBe(42);
+      expect(res.body.segment.label).toBe('Overplanner');
+    });
+
+    it('ignores a snapshot with another version', async () => {
+      await redis.set(snapshotKey(userId), JSON.stringify(workerSnapshot(userId, { version: 99 })));
+
+      const res = await request(app)
+        .get('/insights')
+        .set('Authorization', `Bearer ${accessToken}`)
+        .expect(200);
+
+      expect(res.headers['x-insights-source']).toBe('db');
+      expect(res.body.taskSummary.total).not.toBe(42);
+    });
+
+    it("ignores a snapshot for another user's id", async () => {
+      await redis.set(snapshotKey(userId), JSON.stringify(workerSnapshot('someone-else')));
+
+      const res = await request(app)
+        .get('/insights')
+        .set('Authorization', `Bearer ${accessToken}`)
+        .expect(200);
+
+      expect(res.headers['x-insights-source']).toBe('db');
+    });
+
+    it('rejects without auth', async () => {
+      await request(app).get('/insights').expect(401);
+    });
+  });
+
+  describe('GET /analytics/summary', () => {
+    it('serves the snapshot, then the DB after invalidation', async () => {
+      await redis.set(snapshotKey(userId), JSON.stringify(workerSnapshot(userId)));
+
+      const hit = await request(app)
+        .get('/analytics/summary')
+        .set('Authorization', `Bearer ${accessToken}`)
+        .expect(200);
+      expect(hit.headers['x-insights-source']).toBe('snapshot');
+      expect(hit.body.taskSummary.total).toBe(42);
+
+      await invalidateInsightsSnapshot(userId);
+
+      const miss = await request(app)
+        .get('/analytics/summary')
+        .set('Authorization', `Bearer ${accessToken}`)
+        .expect(200);
+      expect(miss.headers['x-insights-source']).toBe('db');
+      expect(miss.body.taskSummary.total).not.toBe(42);
+    });
+  });
+
+  describe('invalidation on task mutations', () => {
+    async function seedSnapshot() {
+      await redis.set(snapshotKey(userId), JSON.stringify(workerSnapshot(userId)));
+      return Number((await redis.get(snapshotGenerationKey(userId))) ?? 0);
+    }
+
+    async function expectInvalidated(genBefore: number) {
+      expect(await redis.get(snapshotKey(userId))).toBeNull();
+      expect(Number(await redis.get(snapshotGenerationKey(userId)))).toBe(genBefore + 1);
+    }
+
+    it('on create', async () => {
+      const gen = await seedSnapshot();
+      await request(app)
+        .post('/tasks')
+        .set('Authorization', `Bearer ${accessToken}`)
+        .send({ title: 'New task' })
+        .expect(201);
+      await expectInvalidated(gen);
+    });
+
+    it('on update', async () => {
+      const task = await prisma.task.create({ data: { userId, title: 'To update' } });
+      const gen = await seedSnapshot();
+      await request(app)
+        .patch(`/tasks/${task.id}`)
+        .set('Authorization', `Bearer ${accessToken}`)
+        .send({ status: 'CANCELED' })
+        .expect(200);
+      await expectInvalidated(gen);
+    });
+
+    it('on delete', async () => {
+      const task = await prisma.task.create({ data: { userId, title: 'To delete' } });
+      const gen = await seedSnapshot();
+      await request(app)
+        .delete(`/tasks/${task.id}`)
+        .set('Authorization', `Bearer ${accessToken}`)
+        .expect(204);
+      await expectInvalidated(gen);
+    });
+  });
+
+  describe('guarded snapshot write', () => {
+    it('drops a snapshot built before an invalidation', async () => {
+      const generation = await readSnapshotGeneration(userId);
+      const snap = await buildInsightsSnapshot(userId);
+
+      // a mutation commits while the snapshot is in flight
+      await invalidateInsightsSnapshot(userId);
+
+      expect(await writeInsightsSnapshot(snap, generation)).toBe(false);
+      expect(await redis.get(snapshotKey(userId))).toBeNull();
+    });
+
+    it('stores a snapshot when the generation is unchanged', async () => {
+      await invalidateInsightsSnapshot(userId);
+      const generation = await readSnapshotGeneration(userId);
+      const snap = await buildInsightsSnapshot(userId);
+
+      expect(await writeInsightsSnapshot(snap, generation)).toBe(true);
+      expect(await redis.get(snapshotKey(userId))).not.toBeNull();
+    });
+  });
+});
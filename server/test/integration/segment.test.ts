@@ -0,0 +1,175 @@
+import { describe, it, expect, beforeAll, beforeEach, afterAll } from 'vitest';
+import request from 'supertest';
+import { createServer } from '../../src/app/server';
+import { prisma } from '../../src/db/prisma';
+
+const app = createServer();
+
+async function registerAndGetToken(): Promise<{ userId: string; accessToken: string }> {
+  const email = `segment-${Date.now()}-${Math.random().toString(36).slice(2)}@example.com`;
+  const res = await request(app)
+    .post('/auth/register')
+    .send({ email, password: 'password123', name: 'Segment User' });
+  const { user, accessToken } = res.body;
+  return { userId: user.id, accessToken };
+}
+
+// shape written by python-workers/src/cluster_users.py
+function modelCentroids(completionRate: number) {
+  return [
+    { segment: 0, label: 'Finisher', centroid: { completionRate: 0.9, createdCount: 10 } },
+    { segment: 1, label: 'Overplanner', centroid: { completionRate, createdCount: 30 } },
+  ];
+}
+
+describe('Segment API', () => {
+  let accessToken: string;
+  let userId: string;
+  const suffix = Math.random().toString(36).slice(2);
+  const olderModel = `test-older-${suffix}`;
+  const latestModel = `test-latest-${suffix}`;
+
+  beforeAll(async () => {
+    const auth = await registerAndGetToken();
+    accessToken = auth.accessToken;
+    userId = auth.userId;
+
+    await prisma.segmentModel.create({
+      data: {
+        id: olderModel,
+        k: 2,
+        centroids: modelCentroids(0.2),
+        lastUsedAt: new Date(Date.now() - 86400_000),
+      },
+    });
+    await prisma.segmentModel.create({
+      data: { id: latestModel, k: 2, centroids: modelCentroids(0.45), lastUsedAt: new Date() },
+    });
+  });
+
+  beforeEach(async () => {
+    await prisma.userSegment.deleteMany({ where: { userId } });
+  });
+
+  afterAll(async () => {
+    await prisma.segmentModel.deleteMany({ where: { id: { in: [olderModel, latestModel] } } });
+    await prisma.user.deleteMany({ where: { id: userId } });
+  });
+
+  describe('GET /segment', () => {
+    it('returns null without a segment row', async () => {
+      const res = await request(app)
+        .get('/segment')
+        .set('Authorization', `Bearer ${accessToken}`)
+        .expect(200);
+
+      expect(res.body).toEqual({ ok: true, segment: null });
+    });
+
+    it('resolves the centroid from the model the row was assigned with', async () => {
+      await prisma.userSegment.create({
+        data: { userId, segment: 1, label: 'Overplanner', featuresRef: { model: olderModel } },
+      });
+
+      const res = await request(app)
+        .get('/segment')
+        .set('Authorization', `Bearer ${accessToken}`)
+        .expect(200);
+
+      expect(res.body.segment).toMatchObject({ segment: 1, label: 'Overplanner' });
+      expect(res.body.segment.centroid).toEqual({ completionRate: 0.2, createdCount: 30 });
+    });
+
+    it('falls back to the latest model without a model reference', async () => {
+      await prisma.userSegment.create({
+        data: { userId, segment: 1, label: 'Overplanner', featuresRef: { windowDays: 30 } },
+      });
+
+      const res = await request(app)
+        .get('/segment')
+        .set('Authorization', `Bearer ${accessToken}`)
+        .expect(200);
+
+      expect(res.body.segment.centroid).toEqual({ completionRate: 0.45, createdCount: 30 });
+    });
+
+    it('falls back to the latest model when the referenced one is gone', async () => {
+      await prisma.userSegment.create({
+        data: { userId, segment: 0, label: 'Finisher', featuresRef: { model: 'pruned' } },
+      });
+
+      const res = await request(app)
+        .get('/segment')
+        .set('Authorization', `Bearer ${accessToken}`)
+        .expect(200);
+
+      expect(res.body.segment.centroid).toEqual({ completionRate: 0.9, createdCount: 10 });
+    });
+
+    it('ignores a legacy per-row centroid', async () => {
+      await prisma.userSegment.create({
+        data: {
+          userId,
+          segment: 1,
+          label: 'Overplanner',
+          centroid: { completionRate: 0.99 },
+          featuresRef: { model: latestModel },
+        },
+      });
+
+      const res = await request(app)
+        .get('/segment')
+        .set('Authorization', `Bearer ${accessToken}`)
+        .expect(200);
+
+      expect(res.body.segment.centroid).toEqual({ completionRate: 0.45, createdCount: 30 });
+    });
+
+    it('returns a null centroid for a segment the model does not have', async () => {
+      await prisma.userSegment.create({
+        data: { userId, segment: 7, label: 'Balanced', featuresRef: { model: latestModel } },
+      });
+
+      const res = await request(app)
+        .get('/segment')
+        .set('Authorization', `Bearer ${accessToken}`)
+        .expect(200);
+
+      expect(res.body.segment.centroid).toBeNull();
+    });
+  });
+
+  describe('GET /segment/insights', () => {
+    it('uses the resolved centroid for the evidence-based insight', async () => {
+      await prisma.userSegment.create({
+        data: { userId, segment: 1, label: 'Overplanner', featuresRef: { model: olderModel } },
+      });
+
+      const res = await request(app)
+        .get('/segment/insights')
+        .set('Authorization', `Bearer ${accessToken}`)
+        .expect(200);
+
+      expect(res.body.label).toBe('Overplanner');
+      // label insight + low completion rate (0.2) from the assigned model's centroid
+      expect(res.body.insights).toHaveLength(2);
+    });
+
+    it('skips the low-completion insight when the centroid does not support it', async () => {
+      await prisma.userSegment.create({
+        data: { userId, segment: 1, label: 'Overplanner', featuresRef: { model: latestModel } },
+      });
+
+      const res = await request(app)
+        .get('/segment/insights')
+        .set('Authorization', `Bearer ${accessToken}`)
+        .expect(200);
+
+      expect(res.body.insights).toHaveLength(1);
+    });
+
+    it('rejects without auth', async () => {
+      await request(app).get('/segment/insights').expect(401);
+    });
+  });
+});
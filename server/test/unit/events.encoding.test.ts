@@ -0,0 +1,67 @@
+import { describe, it, expect } from 'vitest';
+import { encodeV1Fields, encodeV2, encodeV2Fields } from '../../src/events/encoding';
+
+// Same fixture as python-workers/tests/test_events.py, which decodes V2_EVENTS.
+const events = [
+  {
+    id: 'ev1',
+    type: 'TASK_CREATED',
+    userId: 'u1',
+    taskId: 't1',
+    createdAt: new Date('2026-01-14T14:20:57.153Z'),
+  },
+  {
+    id: 'ev2',
+    type: 'TASK_COMPLETED',
+    userId: 'u1',
+    taskId: 't1',
+    createdAt: new Date('2026-01-14T23:59:59.999Z'),
+  },
+  {
+    id: 'ev3',
+    type: 'TASK_DELETED',
+    userId: 'u2',
+    taskId: null,
+    createdAt: new Date('2026-01-15T00:00:00.000Z'),
+  },
+];
+
+const V2_EVENTS =
+  'ev1\tTASK_CREATED\tu1\tt1\t1768400457153\n' +
+  'ev2\tTASK_COMPLETED\tu1\tt1\t1768435199999\n' +
+  'ev3\tTASK_DELETED\tu2\t\t1768435200000';
+
+describe('event stream encoding', () => {
+  it('encodes v1 fields with ISO createdAt', () => {
+    expect(encodeV1Fields(events[0])).toEqual({
+      version: '1',
+      eventId: 'ev1',
+      type: 'TASK_CREATED',
+      userId: 'u1',
+      createdAt: '2026-01-14T14:20:57.153Z',
+      taskId: 't1',
+    });
+  });
+
+  it('omits taskId in v1 when absent', () => {
+    expect(encodeV1Fields(events[2])).not.toHaveProperty('taskId');
+  });
+
+  it('encodes v2 records as tab-separated lines with epoch ms', () => {
+    expect(encodeV2(events)).toBe(V2_EVENTS);
+  });
+
+  it('wraps v2 records with version and count', () => {
+    expect(encodeV2Fields(events)).toEqual({ version: '2', count: '3', events: V2_EVENTS });
+  });
+
+  it('round-trips v2 records', () => {
+    const decoded = encodeV2(events)
+      .split('\n')
+      .map((line) => {
+        const [id, type, userId, taskId, ms] = line.split('\t');
+        return { id, type, userId, taskId: taskId || null, createdAt: new Date(Number(ms)) };
+      });
+    expect(decoded).toEqual(events);
+  });
+});